@@ -17,21 +17,23 @@ The final processed CSV file (`intensity_metrics.csv`) containing the results fo
 supplemental material.
 """
 
-import copy
 import jdata as jd
 import numpy as np
 import pandas as pd
 
 from floodlight.io.dfl import read_position_data_xml
-from floodlight.models.kinematics import DistanceModel, VelocityModel
-from floodlight.transforms.filter import butterworth_lowpass
 
-from src.utils import distance_covered_per_zone
+from src.match_data import MatchPositions
+from src.frame_selection import load_coverage, check_coverage
+from src.streaming_kinematics import streaming_kinematics
 
 # === Settings ===
 match_id = "DFL-MAT-0002UK"
 source = "SF"
 base_path = "<PATH_TO_FILES>"
+n_frames = 45 * 60 * 25  # first 45 minutes (25 fps)
+teams = ["Home", "Away"]
+chunk_size = 10 * 60 * 25  # frames filtered at a time (10 minutes at 25 fps)
 
 # Mapping roles
 roles = {
@@ -47,36 +49,37 @@ positions, possession, ballstatus, teamsheet, pitch = read_position_data_xml(
     f"{base_path}Infos/{match_id}.xml"
 )
 
-visible = jd.load(f"./data/player_visibility/{source}_{match_id}_visible_with_ballstatus.json")
+visibility_file = f"./data/player_visibility/{source}_{match_id}_visible_with_ballstatus.json"
+visible = jd.load(visibility_file)
 
 # Cut to first 45 minutes (25 fps)
 for half in visible:
     for team in visible[half]:
-        visible[half][team] = visible[half][team][:45 * 60 * 25]
+        visible[half][team] = visible[half][team][:n_frames]
+
+# All frames are read (including ball out of play), so the visibility has to cover all of them
+n_frames_visible = {half: len(visible[half]["Home"]) for half in visible}
+check_coverage(
+    {half: [[0, T]] for half, T in n_frames_visible.items()}, load_coverage(visibility_file), n_frames_visible,
+    "Player visibility"
+)
 
 # Set pitch dimensions
 pitch.xlim, pitch.ylim = ((0, 105), (0, 68))
 
-# Process position and ball status
-for half in positions:
-    ballstatus[half] = ballstatus[half].slice(0, 45 * 60 * 25)
-    for team in positions[half]:
-        positions[half][team] = butterworth_lowpass(
-            positions[half][team].slice(0, 45 * 60 * 25)
-        )
-        positions[half][team].translate((52.5, 34))  # center pitch
+# Process ball status
+for half in ballstatus:
+    ballstatus[half] = ballstatus[half].slice(0, n_frames)
+
+# Store positions in one contiguous block for all halves and teams (filtered chunk-wise below).
+# float64 keeps the speed thresholds of the published intensity metrics unchanged. Parsed positions
+# are released team by team, so they are never held alongside the full container.
+match = MatchPositions.from_floodlight(positions, teams=teams, dtype=np.float64, release=True, endframe=n_frames)
+del positions
 
-# Apply visibility mask
-positions_visible = copy.deepcopy(positions)
+# Apply visibility mask (applied lazily when visible positions are requested)
 if source in ["SF", "TV"]:
-    for half in positions_visible:
-        for team in positions_visible[half]:
-            positions_visible[half][team].x = np.where(
-                visible[half][team] == 0, np.nan, positions_visible[half][team].x
-            )
-            positions_visible[half][team].y = np.where(
-                visible[half][team] == 0, np.nan, positions_visible[half][team].y
-            )
+    match.set_visibility(visible)
 
 # Calculate visibility statistics
 visible_home = np.sum([np.sum(visible["firstHalf"]["Home"], axis=0),
@@ -84,8 +87,8 @@ visible_home = np.sum([np.sum(visible["firstHalf"]["Home"], axis=0),
 visible_away = np.sum([np.sum(visible["firstHalf"]["Away"], axis=0),
                        np.sum(visible["secondHalf"]["Away"], axis=0)], axis=0)
 
-visible_home_percent = visible_home / (len(positions["firstHalf"]["Home"]) + len(positions["secondHalf"]["Home"]))
-visible_away_percent = visible_away / (len(positions["firstHalf"]["Away"]) + len(positions["secondHalf"]["Away"]))
+visible_home_percent = visible_home / (match.n_frames["firstHalf"] + match.n_frames["secondHalf"])
+visible_away_percent = visible_away / (match.n_frames["firstHalf"] + match.n_frames["secondHalf"])
 
 # Match active ratio (ball in play)
 match_active = (np.sum(ballstatus["firstHalf"].code) + np.sum(ballstatus["secondHalf"].code)) / \
@@ -112,59 +115,42 @@ inactive_visible_away = np.nansum([
     np.nansum(visible["secondHalf"]["Away"][~ballstatus["secondHalf"].code.astype(bool)], axis=0)
 ], axis=0) / (np.sum(~np.isnan(visible["firstHalf"]["Away"]), axis=0) + np.sum(~np.isnan(visible["secondHalf"]["Away"]), axis=0))
 
-# Distance and Velocity
+# Distance and high-speed distance (>6.9 m/s), filtered, centered and accumulated chunk by chunk
 distance, distance_visible = {}, {}
-velocity, velocity_visible = {}, {}
+high_speed, high_speed_visible = {}, {}
 
-for half in positions:
+for half in match.halves:
     distance[half], distance_visible[half] = {}, {}
-    velocity[half], velocity_visible[half] = {}, {}
+    high_speed[half], high_speed_visible[half] = {}, {}
 
-    for team in positions[half]:
-        dm = DistanceModel()
-        dm.fit(positions[half][team])
-        distance[half][team] = dm.distance_covered()
-
-        dm.fit(positions_visible[half][team])
-        distance_visible[half][team] = dm.distance_covered()
-
-        vm = VelocityModel()
-        vm.fit(positions[half][team])
-        velocity[half][team] = vm.velocity()
+    for team in match.teams:
+        kinematics = streaming_kinematics(
+            match.xy(half, team), match.framerate, speed_zones=[(6.9, np.inf)], chunk_size=chunk_size,
+            shift=(52.5, 34)  # center pitch (after filtering)
+        )
+        distance[half][team] = kinematics.distance
+        high_speed[half][team] = kinematics.zones()["6.9 to inf"]
 
-        vm.fit(positions_visible[half][team])
-        velocity_visible[half][team] = vm.velocity()
+        kinematics_visible = streaming_kinematics(
+            match.xy(half, team), match.framerate, speed_zones=[(6.9, np.inf)], chunk_size=chunk_size,
+            shift=(52.5, 34), hidden=match.hidden(half, team) if source in ["SF", "TV"] else None
+        )
+        distance_visible[half][team] = kinematics_visible.distance
+        high_speed_visible[half][team] = kinematics_visible.zones()["6.9 to inf"]
 
 # Total distance calculations
-dist_home = np.nansum([np.nansum(distance["firstHalf"]["Home"], axis=0),
-                       np.nansum(distance["secondHalf"]["Home"], axis=0)], axis=0)
-dist_away = np.nansum([np.nansum(distance["firstHalf"]["Away"], axis=0),
-                       np.nansum(distance["secondHalf"]["Away"], axis=0)], axis=0)
-dist_home_visible = np.nansum([np.nansum(distance_visible["firstHalf"]["Home"], axis=0),
-                               np.nansum(distance_visible["secondHalf"]["Home"], axis=0)], axis=0)
-dist_away_visible = np.nansum([np.nansum(distance_visible["firstHalf"]["Away"], axis=0),
-                               np.nansum(distance_visible["secondHalf"]["Away"], axis=0)], axis=0)
+dist_home = np.nansum([distance["firstHalf"]["Home"], distance["secondHalf"]["Home"]], axis=0)
+dist_away = np.nansum([distance["firstHalf"]["Away"], distance["secondHalf"]["Away"]], axis=0)
+dist_home_visible = np.nansum([distance_visible["firstHalf"]["Home"], distance_visible["secondHalf"]["Home"]], axis=0)
+dist_away_visible = np.nansum([distance_visible["firstHalf"]["Away"], distance_visible["secondHalf"]["Away"]], axis=0)
 
 # High-speed distance (>6.9 m/s)
-high_speed_home = np.sum([
-    np.array(distance_covered_per_zone(distance["firstHalf"]["Home"], velocity["firstHalf"]["Home"], [(6.9, np.inf)])["6.9 to inf"]),
-    np.array(distance_covered_per_zone(distance["secondHalf"]["Home"], velocity["secondHalf"]["Home"], [(6.9, np.inf)])["6.9 to inf"])
-], axis=0)
-
-high_speed_away = np.sum([
-    np.array(distance_covered_per_zone(distance["firstHalf"]["Away"], velocity["firstHalf"]["Away"], [(6.9, np.inf)])["6.9 to inf"]),
-    np.array(distance_covered_per_zone(distance["secondHalf"]["Away"], velocity["secondHalf"]["Away"], [(6.9, np.inf)])["6.9 to inf"])
-], axis=0)
-
-high_speed_home_visible = np.sum([
-    np.array(distance_covered_per_zone(distance_visible["firstHalf"]["Home"], velocity_visible["firstHalf"]["Home"], [(6.9, np.inf)])["6.9 to inf"]),
-    np.array(distance_covered_per_zone(distance_visible["secondHalf"]["Home"], velocity_visible["secondHalf"]["Home"], [(6.9, np.inf)])["6.9 to inf"])
-], axis=0)
-
-high_speed_away_visible = np.sum([
-    np.array(distance_covered_per_zone(distance_visible["firstHalf"]["Away"], velocity_visible["firstHalf"]["Away"], [(6.9, np.inf)])["6.9 to inf"]),
-    np.array(distance_covered_per_zone(distance_visible["secondHalf"]["Away"], velocity_visible["secondHalf"]["Away"], [(6.9, np.inf)])["6.9 to inf"])
-], axis=0)
+high_speed_home = np.sum([np.array(high_speed["firstHalf"]["Home"]), np.array(high_speed["secondHalf"]["Home"])], axis=0)
+high_speed_away = np.sum([np.array(high_speed["firstHalf"]["Away"]), np.array(high_speed["secondHalf"]["Away"])], axis=0)
+high_speed_home_visible = np.sum([np.array(high_speed_visible["firstHalf"]["Home"]),
+                                  np.array(high_speed_visible["secondHalf"]["Home"])], axis=0)
+high_speed_away_visible = np.sum([np.array(high_speed_visible["firstHalf"]["Away"]),
+                                  np.array(high_speed_visible["secondHalf"]["Away"])], axis=0)
 
 # Percentages
 dist_home_percent = dist_home_visible / dist_home
@@ -0,0 +1,389 @@
+"""
+check_equivalence.py
+
+This script checks that optimised processing paths reproduce the results of the original
+implementation before they are used for production runs.
+
+Reference and candidate implementations of each stage are run side by side on synthetic
+inputs (camera pans over dummy formations) and compared with stage-specific tolerances:
+
+- Projection (frame selection, polygon reuse): polygon IoU of the pitch intersections.
+- Visibility (frame selection, prepared polygon reuse): exact match of the visibility masks.
+- Formation detection (float32 match container): identical top-5 formations after role
+  assignment and template matching, scores within 1e-6 (as for the published results).
+- Kinematics (chunked filtering): relative error of distances and high-speed distances.
+
+If stored inputs are available (settings `stored_*`), the stages are additionally run on
+them: projection on a stored homography file, visibility on a stored pitch intersection
+file and formation detection and kinematics with the masks of a stored visibility file
+(applied to synthetic positions, as the tracking data cannot be published).
+
+Reference implementations reproduce the original code of the scripts (e.g. a `Point.within`
+check per player), candidates call the code paths used by the scripts now.
+
+If result files of new runs are available, they are additionally compared against the
+published results in `data/results/` (relative error for intensity metrics, exact top-5
+formations). The output is a table with per-stage differences and speed-ups.
+"""
+
+import os
+import copy
+import json
+import warnings
+import numpy as np
+import pandas as pd
+import jdata as jd
+from floodlight import XY
+from floodlight.models.kinematics import DistanceModel, VelocityModel
+from floodlight.transforms.filter import butterworth_lowpass
+from shapely.geometry import Point, Polygon
+
+from src.utils import (
+    vid2pos_reader, homography_series, generate_topview_mask, mask2pitchpolygon, homography2pitchpolygon,
+    player_visibility, distance_covered_per_zone, CoherentFovProjector
+)
+from src.formation import detect_formation
+from src.match_data import MatchPositions
+from src.streaming_kinematics import streaming_kinematics
+from src.constants import POSITIONS_4231, POSITIONS_352
+from src.equivalence import (
+    run_stage, equivalence_report, compare_intersections, compare_visibility, compare_predictions, compare_values,
+    compare_intensity_metrics, compare_formation_detection
+)
+
+# Suppress warnings
+warnings.filterwarnings("ignore")
+
+# === Settings ===
+n_frames = 2 * 60 * 25  # length of the synthetic half (2 minutes at 25 fps)
+seed = 0
+run_projection = True  # requires torch/kornia/rasterio (imported by the projection helpers only)
+reuse_tolerance = 0.1  # max. corner displacement in metres for reusing polygons
+chunk_size = 20 * 25  # frames filtered at a time (20 seconds at 25 fps)
+rotation = {"Home": 90, "Away": -90}  # direction of play of the synthetic teams
+results_path = "./data/results/"
+candidate_intensity_file = None  # e.g. "<PATH_TO_FILES>intensity_metrics.csv"
+candidate_formation_files = {}  # e.g. {"SF": "<PATH_TO_FILES>formation_detection_SF.csv"}
+
+# Stored inputs (None: synthetic inputs only), only the first `stored_n_frames` frames of a half are used
+stored_homography_file = None  # e.g. "./data/homography_matrices/TV_S_DFL-MAT-0002UK_H0_filtered.jsonl"
+stored_intersections_file = None  # e.g. "./data/pitch_intersections/TV_DFL-MAT-0002UK_intersection.json"
+stored_visibility_file = None  # e.g. "./data/player_visibility/TV_DFL-MAT-0002UK_visible_with_ballstatus.json"
+stored_n_frames = 5 * 60 * 25  # 5 minutes at 25 fps
+
+rng = np.random.default_rng(seed)
+
+
+# === Synthetic Inputs ===
+
+def homography_from_points(source, target):
+    """Estimates the homography mapping four source points onto four target points (DLT)."""
+    A = []
+    for (x, y), (u, v) in zip(source, target):
+        A.append([-x, -y, -1, 0, 0, 0, u * x, u * y, u])
+        A.append([0, 0, 0, -x, -y, -1, v * x, v * y, v])
+    H = np.linalg.svd(np.array(A, dtype=float))[2][-1].reshape(3, 3)
+    return H / H[2, 2]
+
+
+def synthetic_homographies(n_frames):
+    """Broadcast-like camera panning along the pitch (image to centered pitch coordinates)."""
+    image_corners = [(0, 0), (1280, 0), (1280, 720), (0, 720)]
+    pan = np.clip(np.cumsum(rng.normal(0, 0.15, n_frames)) + 20 * np.sin(np.arange(n_frames) / 500), -35, 35)
+    return np.array([
+        homography_from_points(image_corners, [(x - 40, 40), (x + 40, 40), (x + 15, -20), (x - 15, -20)])
+        for x in pan
+    ])
+
+
+def synthetic_intersections(homography_matrices):
+    """Analytic pitch intersections ((2 x n) coordinate arrays) of the homography series."""
+    image_corners = np.array([[0, 0, 1], [1280, 0, 1], [1280, 720, 1], [0, 720, 1]]).T
+    pitch = Polygon([(0, 0), (105, 0), (105, 68), (0, 68)])
+    intersections = []
+    for H in homography_matrices:
+        corners = H @ image_corners
+        corners = corners[:2] / corners[2] + np.array([[52.5], [34]])
+        polygon = Polygon(corners.T).intersection(pitch)
+        intersections.append(np.array(polygon.exterior.xy) if not polygon.is_empty else None)
+    return intersections
+
+
+def synthetic_positions(formation, n_frames, n_players=None):
+    """Players moving around their formation positions with occasional sprints and missing data.
+
+    With `n_players`, the formation positions are repeated to match the players of a stored
+    visibility file.
+    """
+    if n_players is not None:
+        formation = np.resize(formation, 2 * n_players)
+    velocity = np.zeros((n_frames, len(formation)))
+    for t in range(1, n_frames):
+        velocity[t] = 0.97 * velocity[t - 1] + rng.normal(0, 0.04, len(formation))
+    xy = np.array(formation, dtype=float) + np.cumsum(velocity, axis=0)
+    xy[rng.random(xy.shape[0]) < 0.01, :2] = np.nan
+    return XY(xy, framerate=25)
+
+
+def synthetic_selection(n_frames, length=250):
+    """Every other range of `length` frames."""
+    return (np.arange(n_frames) // length) % 2 == 0
+
+
+def synthetic_phases(n_frames, length=250, step=400):
+    """Possession phases (half, team, start_frame, end_frame) alternating between teams."""
+    return [
+        (half, ["Home", "Away"][i % 2], start, start + length)
+        for half in ["firstHalf", "secondHalf"]
+        for i, start in enumerate(range(0, n_frames - length, step))
+    ]
+
+
+# === Reference and Candidate Implementations ===
+
+def project_original(homography_matrices, selected):
+    """Top-view mask and polygon for every frame (original implementation)."""
+    polygons = []
+    for homography in homography_matrices:
+        mask = generate_topview_mask(homography, target_scale=1).numpy()
+        polygons.append(mask2pitchpolygon(np.round(mask), 1))
+    return polygons
+
+
+def project_selected(homography_matrices, selected):
+    return [homography2pitchpolygon(H) if is_selected else None
+            for H, is_selected in zip(homography_matrices, selected)]
+
+
+def project_reuse(homography_matrices, selected):
+    projector = CoherentFovProjector(tolerance=reuse_tolerance)
+    return [projector(H) for H in homography_matrices]
+
+
+def visibility_original(positions, intersections, selected):
+    """Point-by-point check with a new Polygon for every frame (original implementation)."""
+    visibility = np.ones((len(positions), positions.N))
+    for frame_idx, frame in enumerate(positions):
+        coords = intersections[frame_idx]
+        if coords is None:
+            visibility[frame_idx, :] = 0
+            continue
+        polygon = Polygon(zip(coords[0], coords[1]))
+        for player_idx, (x, y) in enumerate(zip(frame[::2], frame[1::2])):
+            if not np.isnan((x, y)).any() and not Point(x, y).within(polygon):
+                visibility[frame_idx, player_idx] = 0
+    return np.where(np.isnan(positions.x), np.nan, visibility)
+
+
+def visibility_reuse(positions, intersections, selected):
+    """Prepared polygons, reused while the pitch intersection does not change (script path)."""
+    return player_visibility(positions, intersections)
+
+
+def visibility_selected(positions, intersections, selected):
+    """Selected frames only (script path)."""
+    return player_visibility(positions, intersections, frames=selected)
+
+
+def formation_original(positions, visible, phases, templates):
+    """Positions masked in place per half and team and sliced per phase (original implementation)."""
+    positions = copy.deepcopy(positions)
+    for half in positions:
+        for team in positions[half]:
+            positions[half][team].x = np.where(visible[half][team] == 0, np.nan, positions[half][team].x)
+            positions[half][team].y = np.where(visible[half][team] == 0, np.nan, positions[half][team].y)
+    predictions = []
+    for half, team, start, end in phases:
+        slice = positions[half][team].slice(start, end)
+        slice.rotate(rotation[team])
+        predictions.append(detect_formation(slice.xy, templates))
+    return predictions
+
+
+def formation_container(positions, visible, phases, templates):
+    """Float32 match container with lazily applied visibility mask, phases copied as float64 (script path)."""
+    match = MatchPositions.from_floodlight(positions, teams=list(positions["firstHalf"]))
+    match.set_visibility(visible)
+    predictions = []
+    for half, team, start, end in phases:
+        slice = match.to_xy(half, team, visible_only=True, startframe=start, endframe=end, dtype=np.float64)
+        slice.rotate(rotation[team])
+        predictions.append(detect_formation(slice.xy, templates))
+    return predictions
+
+
+def _kinematic_totals(xy, xy_visible):
+    totals = []
+    for positions in (xy, xy_visible):
+        dm, vm = DistanceModel(), VelocityModel()
+        dm.fit(positions)
+        vm.fit(positions)
+        totals.append(np.nansum(dm.distance_covered(), axis=0))
+        totals.append(np.array(
+            distance_covered_per_zone(dm.distance_covered(), vm.velocity(), [(6.9, np.inf)])["6.9 to inf"]
+        ))
+    return np.concatenate(totals)
+
+
+def kinematics_filtered(positions, visible):
+    """Whole-half Butterworth filter, centered pitch, distance and velocity models (original implementation)."""
+    totals = []
+    for half in positions:
+        for team in positions[half]:
+            xy = butterworth_lowpass(positions[half][team])
+            xy.translate((52.5, 34))
+            xy_visible = XY(xy.xy.copy(), framerate=xy.framerate)
+            xy_visible.xy.reshape(len(xy), -1, 2)[visible[half][team] == 0] = np.nan
+            totals.append(_kinematic_totals(xy, xy_visible))
+    return np.concatenate(totals)
+
+
+def kinematics_chunked(positions, visible):
+    """Chunk-wise filtering and accumulation on the match container."""
+    match = MatchPositions.from_floodlight(positions, teams=list(positions["firstHalf"]), dtype=np.float64)
+    match.set_visibility(visible)
+    totals = []
+    for half in match.halves:
+        for team in match.teams:
+            for hidden in (None, match.hidden(half, team)):
+                kinematics = streaming_kinematics(
+                    match.xy(half, team), match.framerate, speed_zones=[(6.9, np.inf)], chunk_size=chunk_size,
+                    shift=(52.5, 34), hidden=hidden
+                )
+                totals.append(kinematics.distance)
+                totals.append(np.array(kinematics.zones()["6.9 to inf"]))
+    return np.concatenate(totals)
+
+
+# === Main Script ===
+
+def projection_stages(homography_matrices, selected, label=""):
+    if not run_projection:
+        return []
+    inputs = {"homography_matrices": homography_matrices, "selected": selected}
+    return [
+        run_stage(f"projection (frame selection{label})", project_original, project_selected, inputs,
+                  compare_intersections, min_iou=0.99, frames=np.flatnonzero(selected)),
+        run_stage(f"projection (polygon reuse{label})", project_original, project_reuse, inputs,
+                  compare_intersections, min_iou=0.98)
+    ]
+
+
+def visibility_stages(positions, intersections, selected, label=""):
+    inputs = {"positions": positions, "intersections": intersections, "selected": selected}
+    return [
+        run_stage(f"visibility (polygon reuse{label})", visibility_original, visibility_reuse, inputs,
+                  compare_visibility),
+        run_stage(f"visibility (frame selection{label})", visibility_original, visibility_selected, inputs,
+                  compare_visibility, frames=selected)
+    ]
+
+
+def match_stages(positions, visible, templates, label=""):
+    # goalkeepers (first player) are excluded from formation detection
+    positions_outfield = copy.deepcopy(positions)
+    for half in positions_outfield:
+        for team in positions_outfield[half]:
+            positions_outfield[half][team].xy[:, :2] = np.nan
+    n_frames = len(positions["firstHalf"]["Home"])
+    return [
+        run_stage(
+            f"formation (float32 container{label})", formation_original, formation_container,
+            {"positions": positions_outfield, "visible": visible, "phases": synthetic_phases(n_frames),
+             "templates": templates},
+            compare_predictions, atol=1e-6
+        ),
+        run_stage(
+            f"kinematics (chunked filtering{label})", kinematics_filtered, kinematics_chunked,
+            {"positions": positions, "visible": visible},
+            compare_values, rtol=1e-6
+        )
+    ]
+
+
+with open("./data/templates.json") as f:
+    templates = json.load(f)
+
+homography_matrices = synthetic_homographies(n_frames)
+intersections = synthetic_intersections(homography_matrices)
+selected = synthetic_selection(n_frames)
+positions = {
+    half: {
+        "Home": synthetic_positions(POSITIONS_4231, n_frames),
+        "Away": synthetic_positions(POSITIONS_352, n_frames)
+    }
+    for half in ["firstHalf", "secondHalf"]
+}
+
+results = projection_stages(homography_matrices, selected)
+
+# near-static camera: pitch intersection only updated every 10 frames (copies, as loaded from the JSON file)
+static_intersections = [
+    copy.deepcopy(intersections[frame_idx - frame_idx % 10]) for frame_idx in range(n_frames)
+]
+results.append(run_stage(
+    "visibility (polygon reuse)", visibility_original, visibility_reuse,
+    {"positions": positions["firstHalf"]["Home"], "intersections": static_intersections, "selected": selected},
+    compare_visibility
+))
+results.append(run_stage(
+    "visibility (frame selection)", visibility_original, visibility_selected,
+    {"positions": positions["firstHalf"]["Home"], "intersections": intersections, "selected": selected},
+    compare_visibility, frames=selected
+))
+
+visible = {
+    half: {team: visibility_original(positions[half][team], intersections, selected) for team in positions[half]}
+    for half in positions
+}
+results += match_stages(positions, visible, templates)
+
+# === Stored Inputs ===
+
+if stored_homography_file is not None:
+    stored_homographies = homography_series(vid2pos_reader(stored_homography_file), stored_n_frames)[0]
+    results += projection_stages(stored_homographies, synthetic_selection(stored_n_frames), ", stored")
+
+if stored_intersections_file is not None:
+    stored_intersections = jd.load(stored_intersections_file)["firstHalf"][:stored_n_frames]
+    results += visibility_stages(
+        synthetic_positions(POSITIONS_4231, len(stored_intersections)), stored_intersections,
+        synthetic_selection(len(stored_intersections)), ", stored"
+    )
+
+if stored_visibility_file is not None:
+    stored_visible = jd.load(stored_visibility_file)
+    stored_visible = {
+        half: {team: np.asarray(stored_visible[half][team])[:stored_n_frames] for team in ["Home", "Away"]}
+        for half in ["firstHalf", "secondHalf"]
+    }
+    stored_positions = {
+        half: {
+            team: synthetic_positions(formation, *stored_visible[half][team].shape)
+            for team, formation in [("Home", POSITIONS_4231), ("Away", POSITIONS_352)]
+        }
+        for half in stored_visible
+    }
+    # players without a position in the stored visibility (e.g. substitutes) have no position
+    for half in stored_positions:
+        for team in stored_positions[half]:
+            xy = stored_positions[half][team].xy
+            xy.reshape(len(xy), -1, 2)[np.isnan(stored_visible[half][team])] = np.nan
+    results += match_stages(stored_positions, stored_visible, templates, ", stored")
+
+report = equivalence_report(results)
+print(report.to_string(index=False))
+
+# === Stored Results ===
+
+if candidate_intensity_file is not None and os.path.exists(candidate_intensity_file):
+    intensity_report = compare_intensity_metrics(
+        pd.read_csv(f"{results_path}intensity_metrics.csv"), pd.read_csv(candidate_intensity_file)
+    )
+    print(intensity_report.to_string(index=False))
+
+for source, candidate_file in candidate_formation_files.items():
+    formation_result = compare_formation_detection(
+        pd.read_csv(f"{results_path}results_formation_detection.csv"), pd.read_csv(candidate_file), source
+    )
+    print(f"Formation detection ({source}): {formation_result}")
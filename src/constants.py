@@ -4,6 +4,8 @@ constants.py
 This module defines constants used across the project, including:
 
 - MATCH_LENGTH: Number of frames for first and second halves per match.
+- MATCH_NAMES: Match names as used in the phase labels (`majority.csv`).
+- KICKOFF_OFFSETS: Video/tracking frame offsets for first and second halves per match.
 - POSITIONS_4231: Idealized player coordinates for a 4-2-3-1 formation for dummy data.
 - POSITIONS_352: Idealized player coordinates for a 3-5-2 formation for dummy data.
 """
@@ -16,6 +18,20 @@ MATCH_LENGTH = {
     "DFL-MAT-000322": {"firstHalf": 67702, "secondHalf": 68178}
 }
 
+MATCH_NAMES = {
+    "DFL-MAT-0002UK": "Leverkusen - Gladbach",
+    "DFL-MAT-0002YP": "Leverkusen - Bremen",
+    "DFL-MAT-000303": "Bremen - Köln",
+    "DFL-MAT-000322": "Leverkusen - Köln"
+}
+
+KICKOFF_OFFSETS = {
+    "DFL-MAT-0002UK": {"firstHalf": 1695 - 1700, "secondHalf": 71593 - 71613},
+    "DFL-MAT-0002YP": {"firstHalf": 4927 - 4935, "secondHalf": 74898 - 74885},
+    "DFL-MAT-000303": {"firstHalf": 5669 - 5729, "secondHalf": 73869 - 73861},
+    "DFL-MAT-000322": {"firstHalf": 3982 - 4003, "secondHalf": 73036 - 73040}
+}
+
 POSITIONS_4231 = [
     # Goalkeeper
     5, 34,
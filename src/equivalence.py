@@ -0,0 +1,249 @@
+"""
+equivalence.py
+
+This module provides helper functions for checking that optimised processing engines
+reproduce the results of the original implementation:
+
+- Comparing pitch intersections by polygon IoU (`compare_intersections`).
+- Comparing visibility masks exactly (`compare_visibility`).
+- Comparing top-5 formation predictions (`compare_predictions`).
+- Comparing numeric values by relative and absolute error (`compare_values`).
+- Comparing result tables against the published results
+  (`compare_intensity_metrics`, `compare_formation_detection`).
+- Running reference and candidate implementations side by side (`run_stage`) and
+  summarising the results (`equivalence_report`).
+"""
+
+import ast
+import time
+import numpy as np
+import pandas as pd
+from shapely.geometry import Polygon
+
+
+def _as_polygon(polygon):
+    """Converts (2 x n) coordinate arrays as stored in the pitch intersection files to Polygons."""
+    if polygon is None or isinstance(polygon, Polygon):
+        return polygon
+    return Polygon(zip(polygon[0], polygon[1]))
+
+
+def polygon_iou(polygon_a, polygon_b):
+    """Calculates the intersection over union of two polygons (1 if both are None)."""
+    polygon_a, polygon_b = _as_polygon(polygon_a), _as_polygon(polygon_b)
+    if polygon_a is None and polygon_b is None:
+        return 1.
+    if polygon_a is None or polygon_b is None:
+        return 0.
+    union = polygon_a.union(polygon_b).area
+    return polygon_a.intersection(polygon_b).area / union if union > 0 else 1.
+
+
+def compare_intersections(reference, candidate, min_iou=0.99, frames=None):
+    """Compares frame-wise pitch intersections by polygon IoU.
+
+    Parameters
+    ----------
+    reference, candidate: list
+        Frame-wise polygons (shapely Polygons, (2 x n) coordinate arrays or None).
+    min_iou: float
+        Minimum IoU for a frame to pass.
+    frames: np.ndarray, optional
+        Indices of the frames to compare (e.g. the selected frames). Defaults to all.
+
+    Returns
+    -------
+    result: dict
+        Dictionary with the number of compared frames, the number of failed frames,
+        the minimum and mean IoU and whether all frames passed.
+    """
+    if frames is None:
+        frames = range(len(reference))
+    iou = np.array([polygon_iou(reference[i], candidate[i]) for i in frames])
+    return {
+        "n": len(iou),
+        "n_failed": int(np.sum(iou < min_iou)),
+        "min_iou": float(iou.min()) if len(iou) else np.nan,
+        "mean_iou": float(iou.mean()) if len(iou) else np.nan,
+        "passed": bool(np.all(iou >= min_iou)),
+    }
+
+
+def compare_visibility(reference, candidate, frames=None):
+    """Compares visibility masks (T x N) exactly, treating NaN entries as equal."""
+    reference, candidate = np.asarray(reference, dtype=float), np.asarray(candidate, dtype=float)
+    if frames is not None:
+        reference, candidate = reference[frames], candidate[frames]
+    if reference.shape != candidate.shape:
+        return {"n": reference.size, "n_failed": reference.size, "passed": False}
+    equal = (reference == candidate) | (np.isnan(reference) & np.isnan(candidate))
+    return {"n": reference.size, "n_failed": int(np.sum(~equal)), "passed": bool(equal.all())}
+
+
+def _parse_predictions(predictions):
+    if isinstance(predictions, str):
+        return ast.literal_eval(predictions)
+    return predictions
+
+
+def compare_predictions(reference, candidate, atol=1e-6):
+    """Compares top-5 formation predictions.
+
+    The formation names and their order have to match exactly, scores may differ by `atol`.
+
+    Parameters
+    ----------
+    reference, candidate: list
+        Predictions per phase, each a list of (formation, score) tuples or its string
+        representation as stored in the result files.
+    """
+    n_failed, max_abs_error = 0, 0.
+    for predictions_ref, predictions_cand in zip(reference, candidate):
+        predictions_ref, predictions_cand = _parse_predictions(predictions_ref), _parse_predictions(predictions_cand)
+        names_ref = [formation for formation, _ in predictions_ref]
+        names_cand = [formation for formation, _ in predictions_cand]
+        errors = [abs(score_ref - score_cand)
+                  for (_, score_ref), (_, score_cand) in zip(predictions_ref, predictions_cand)]
+        max_abs_error = max([max_abs_error] + errors)
+        if names_ref != names_cand or any(error > atol for error in errors):
+            n_failed += 1
+    return {
+        "n": len(reference),
+        "n_failed": n_failed,
+        "max_abs_error": max_abs_error,
+        "passed": n_failed == 0 and len(reference) == len(candidate),
+    }
+
+
+def compare_values(reference, candidate, rtol=1e-6, atol=0.):
+    """Compares numeric values, treating NaN entries as equal.
+
+    A value passes if |candidate - reference| <= atol + rtol * |reference|, i.e. `atol`
+    covers reference values of (almost) zero, for which the relative error is undefined.
+    """
+    reference, candidate = np.asarray(reference, dtype=float), np.asarray(candidate, dtype=float)
+    both_nan = np.isnan(reference) & np.isnan(candidate)
+    abs_error = np.where(both_nan, 0., np.abs(candidate - reference))
+    abs_error = np.where(np.isnan(abs_error), np.inf, abs_error)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = np.where(abs_error <= atol, 0., abs_error / np.abs(reference))
+    error = np.where(np.isnan(error), np.inf, error)
+    failed = ~both_nan & ~(abs_error <= atol + rtol * np.abs(reference))
+    return {
+        "n": reference.size,
+        "n_failed": int(np.sum(failed)),
+        "max_rel_error": float(error.max()) if reference.size else np.nan,
+        "max_abs_error": float(abs_error.max()) if reference.size else np.nan,
+        "passed": not failed.any(),
+    }
+
+
+def _merge_rows(reference, candidate, keys, groups):
+    """Outer-merges two result tables on `keys` after restricting the reference to the `groups`
+    (e.g. match and source) of the candidate. Returns the merged table and a mask of the rows
+    that exist in both tables."""
+    keys, groups = list(keys), list(groups)
+    candidate_groups = candidate[groups].drop_duplicates()
+    reference = reference.merge(candidate_groups, on=groups)
+    merged = reference.merge(candidate, on=keys, how="outer", suffixes=("_ref", "_cand"), indicator=True)
+    return merged, (merged["_merge"] == "both").to_numpy()
+
+
+def compare_intensity_metrics(reference, candidate, rtol=1e-6, atol=1e-6, keys=("match", "source", "pID")):
+    """Compares intensity metrics (e.g. `intensity_metrics.csv`) per numeric column.
+
+    The reference is restricted to the matches and sources of the candidate, i.e. a
+    candidate file of a single match can be compared against the published results of all
+    matches. Players missing in either table are reported in the first row ("rows") and
+    fail the comparison.
+
+    Returns
+    -------
+    report: pd.DataFrame
+        One row per numeric column with the comparison result.
+    """
+    merged, matched = _merge_rows(reference, candidate, keys, ["match", "source"])
+    columns = [
+        column for column in reference.columns
+        if column not in keys and f"{column}_cand" in merged and pd.api.types.is_numeric_dtype(reference[column])
+    ]
+    n_unmatched = int(np.sum(~matched))
+    rows = [{"field": "rows", "n": len(merged), "n_failed": n_unmatched, "passed": n_unmatched == 0}]
+    for column in columns:
+        result = compare_values(
+            merged.loc[matched, f"{column}_ref"], merged.loc[matched, f"{column}_cand"], rtol=rtol, atol=atol
+        )
+        rows.append({"field": column, **result})
+
+    return pd.DataFrame(rows)
+
+
+def compare_formation_detection(reference, candidate, source, atol=1e-6,
+                                keys=("match", "number", "team", "possession")):
+    """Compares the predictions of a `formation_detection.py` run (column "predictions")
+    against the published results (e.g. `results_formation_detection.csv`, column
+    "predictions_<source>").
+
+    The reference is restricted to the matches with predictions in the candidate. Phases
+    that are missing in either table or have no prediction count as failed.
+    """
+    candidate = candidate[list(keys) + ["predictions"]]
+    candidate = candidate[candidate["match"].isin(candidate.loc[candidate["predictions"].notna(), "match"])]
+    merged, matched = _merge_rows(reference, candidate, keys, ["match"])
+    matched &= (merged[f"predictions_{source.lower()}"].notna() & merged["predictions"].notna()).to_numpy()
+    result = compare_predictions(
+        merged.loc[matched, f"predictions_{source.lower()}"], merged.loc[matched, "predictions"], atol=atol
+    )
+    n_unmatched = int(np.sum(~matched))
+    return {
+        **result,
+        "n": len(merged),
+        "n_failed": result["n_failed"] + n_unmatched,
+        "n_unmatched": n_unmatched,
+        "passed": result["passed"] and n_unmatched == 0,
+    }
+
+
+def time_stage(function, *args, **kwargs):
+    """Runs a function and returns its result and the runtime in seconds."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_stage(name, reference_function, candidate_function, inputs, comparator, **comparator_kwargs):
+    """Runs the reference and candidate implementation of a stage on the same inputs.
+
+    Parameters
+    ----------
+    name: str
+        Name of the stage, e.g. "projection".
+    reference_function, candidate_function: callable
+        Original and optimised implementation, both called with `inputs`.
+    inputs: dict
+        Keyword arguments of both implementations.
+    comparator: callable
+        Comparison function, e.g. `compare_intersections`, called with both results.
+
+    Returns
+    -------
+    result: dict
+        Comparison result with stage name, runtimes and speed-up.
+    """
+    reference, reference_time = time_stage(reference_function, **inputs)
+    candidate, candidate_time = time_stage(candidate_function, **inputs)
+    result = comparator(reference, candidate, **comparator_kwargs)
+    return {
+        "stage": name,
+        **result,
+        "reference_seconds": reference_time,
+        "candidate_seconds": candidate_time,
+        "speedup": reference_time / candidate_time if candidate_time > 0 else np.inf,
+    }
+
+
+def equivalence_report(results):
+    """Summarises stage results as returned by `run_stage` in a DataFrame."""
+    columns = ["stage", "passed", "n", "n_failed", "reference_seconds", "candidate_seconds", "speedup"]
+    report = pd.DataFrame(results)
+    return report[[c for c in columns if c in report] + [c for c in report if c not in columns]]
@@ -0,0 +1,90 @@
+"""
+estimate_sync_offsets.py
+
+This script estimates the frame offset between the broadcast video and the tracking data
+for both halves of every match. The camera pan derived from the homography series is
+cross-correlated with the horizontal ball motion from the tracking data.
+The output is a JSON file per match in `data/sync_offsets/` (created if missing) containing
+the offset (tracking frame = video frame + offset), the correlation score and a reliability
+flag per half. It is read by
+`formation_detection.py`, `generate_frame_selection.py` and `generate_pitch_intersections.py`,
+replacing the manual offset search for new matches (published offsets in `KICKOFF_OFFSETS`
+are only used for halves without a reliable estimate).
+
+---
+Information for the User:
+
+Due to licensing restrictions the raw XML files (`Positions/`, `Infos/`) that are required by the
+`read_position_data_xml()` function used in this script are not provided with this paper.
+"""
+
+import os
+import json
+import warnings
+
+from floodlight.io.dfl import read_position_data_xml
+
+from src.utils import homography_series
+from src.synchronisation import estimate_sync_offsets
+from src.prefetch import Prefetcher, file_size, load_homographies
+from src.constants import MATCH_LENGTH
+
+# Suppress warnings
+warnings.filterwarnings("ignore")
+
+# === Settings ===
+base_path = "./data/"
+path = "<PATH_TO_FILES>"
+match_ids = list(MATCH_LENGTH)
+video_source = "TV"
+max_lag = 30 * 25  # search window (30 seconds at 25 fps) around aligning the first homography with the first tracking frame
+min_score = 0.3  # offsets with a lower correlation score are flagged as not reliable
+prefetch_bytes = 4 * 1024 ** 3  # budget for the input files (size on disk) of the current and prefetched matches
+output_path = f"{base_path}sync_offsets/"
+
+os.makedirs(output_path, exist_ok=True)
+
+
+def input_files(match_id):
+    return [
+        f"{base_path}homography_matrices/{video_source}_S_{match_id}_H0_filtered.jsonl",
+        f"{base_path}homography_matrices/{video_source}_S_{match_id}_H1_filtered.jsonl",
+        f"{path}/Positions/{match_id}.xml",
+        f"{path}/Infos/{match_id}.xml"
+    ]
+
+
+def load_inputs(match_id):
+    """Loads homography files and position data of a match (runs on a background thread)."""
+    positions, _, _, _, _ = read_position_data_xml(*input_files(match_id)[2:])
+    return {"homography_data": load_homographies(base_path, video_source, match_id), "positions": positions}
+
+
+# Load inputs of the next match while the current match is processed
+for match_id, inputs in Prefetcher(match_ids, load_inputs, size_function=lambda m: file_size(*input_files(m)),
+                                   max_bytes=prefetch_bytes):
+    # Interpolate and smooth homography matrices (halves without valid homographies are skipped)
+    homography_matrices, first_frames = {}, {}
+    for half in inputs["homography_data"]:
+        try:
+            homography_matrices[half], first_frames[half] = homography_series(
+                inputs["homography_data"][half], MATCH_LENGTH[match_id][half]
+            )
+        except ValueError as error:
+            print(f"{match_id} {half}: {error}")
+
+    # Estimate offsets
+    offsets = estimate_sync_offsets(
+        homography_matrices, inputs["positions"], first_frames=first_frames, max_lag=max_lag, reference="Ball",
+        min_score=min_score
+    )
+    for half, result in offsets.items():
+        if result["offset"] is None:
+            print(f"{match_id} {half}: no offset (missing or constant camera pan)")
+        else:
+            print(f"{match_id} {half}: offset {result['offset']} frames (score {result['score']:.3f}"
+                  f"{'' if result['reliable'] else ', not reliable'})")
+
+    # Save result as .json
+    with open(f"{output_path}{video_source}_{match_id}_offsets.json", "w") as f:
+        json.dump(offsets, f, indent=2)
@@ -0,0 +1,97 @@
+"""
+formation.py
+
+This module provides the formation detection algorithms of Experiment 2, shared by
+`formation_detection.py` and `check_equivalence.py`:
+
+- Assigning players to roles frame by frame (`role_assignment`).
+- Scoring formation templates against average role positions (`template_matching`).
+- Detecting the top formation candidates of a possession phase (`detect_formation`).
+"""
+
+import numpy as np
+
+from scipy.spatial.distance import cdist
+from scipy.optimize import linear_sum_assignment
+
+
+def role_assignment(slice_xy, avg_positions):
+    """Role assignment algorithm from Bialkowski et al."""
+    solved_positions = np.full((len(slice_xy), 10, 2), np.nan)
+
+    nan_cols = np.argwhere(np.isnan(slice_xy).all(axis=0)).reshape(-1)
+    slice_nonan = np.delete(slice_xy, nan_cols, 1)
+    avg_positions = np.delete(avg_positions, nan_cols, 0)
+
+    for i, frame in enumerate(slice_nonan):
+        frame_nan = np.argwhere(np.isnan(frame)).reshape(-1)
+        frame_nonan = np.delete(frame, frame_nan)
+
+        cost_matrix = cdist(frame.reshape(-1, 2), avg_positions.reshape(-1, 2))
+        cost_matrix = np.where(np.isnan(cost_matrix), 1e6, cost_matrix)
+
+        row, col = linear_sum_assignment(cost_matrix)
+
+        solved_frame = np.full((10, 2), np.nan)
+        solved_frame[row] = frame.reshape(-1, 2)[col]
+        solved_positions[i] = solved_frame
+
+    return solved_positions
+
+
+def template_matching(avg_positions_scaled, templates):
+    """Template matching algorithm by Müller-Budack et al."""
+    scores = {}
+    for formation, coords in templates.items():
+        coords = np.array(coords)
+
+        form_min_x, form_max_x = np.nanmin(coords[:, 0]), np.nanmax(coords[:, 0])
+        form_min_y, form_max_y = np.nanmin(coords[:, 1]), np.nanmax(coords[:, 1])
+
+        scaled_form_x = (coords[:, 0] - form_min_x) / (form_max_x - form_min_x)
+        scaled_form_y = (coords[:, 1] - form_min_y) / (form_max_y - form_min_y)
+        scaled_form = np.column_stack((scaled_form_x, scaled_form_y))
+
+        cost_matrix = np.square(cdist(avg_positions_scaled, scaled_form))
+        row, col = linear_sum_assignment(cost_matrix)
+
+        cost = cost_matrix[row, col].mean()
+        scores[formation] = 1 - cost * 3
+
+    return scores
+
+
+def detect_formation(slice_xy, templates, n=5):
+    """Detects the formation of a possession phase.
+
+    Parameters
+    ----------
+    slice_xy: np.ndarray
+        Positions (T x 2N) of the team in possession, rotated into the direction of play.
+        Columns without any position (e.g. the goalkeeper) are ignored.
+    templates: dict
+        Formation templates {formation: list of (x, y)}, e.g. from `templates.json`.
+    n: int
+        Number of formation candidates to return.
+
+    Returns
+    -------
+    predictions: list
+        Top-n (formation, score) tuples, sorted by score.
+    """
+    avg_pos = np.nanmean(slice_xy, axis=0)
+    solved_pos = role_assignment(slice_xy, avg_pos)
+    avg_pos_solved = np.nanmean(solved_pos, axis=0)
+
+    # Normalize solved positions to match templates
+    min_x, max_x = np.nanmin(avg_pos_solved[:, 0]), np.nanmax(avg_pos_solved[:, 0])
+    min_y, max_y = np.nanmin(avg_pos_solved[:, 1]), np.nanmax(avg_pos_solved[:, 1])
+    scaled_x = (avg_pos_solved[:, 0] - min_x) / (max_x - min_x)
+    scaled_y = (avg_pos_solved[:, 1] - min_y) / (max_y - min_y)
+    scaled_xy = np.column_stack((scaled_x, scaled_y))
+
+    scaled_xy = scaled_xy[~np.isnan(scaled_xy).all(axis=1)]
+
+    fsims = template_matching(scaled_xy, templates)
+
+    return sorted(fsims.items(), key=lambda x: x[1], reverse=True)[:n]
@@ -3,6 +3,8 @@ formation_detection.py
 
 This script detects the formations based on template matching for Experiment 2.
 The output is a CSV file containing the predicted formations for each labeled possession phases.
+The positions and visibility of the next match are loaded in the background (`Prefetcher`)
+while the phases of the current match are processed.
 
 ---
 Information for the User:
@@ -18,63 +20,18 @@ supplemental material.
 """
 
 import json
-import jdata as jd
 import numpy as np
 import pandas as pd
 
 from floodlight.io.dfl import read_position_data_xml
-from floodlight.models.geometry import CentroidModel
 
-from scipy.spatial.distance import cdist
-from scipy.optimize import linear_sum_assignment
-
-
-# === Helper Functions ===
-
-def role_assignment(slice_xy, avg_positions):
-    """Role assignment algorithm from Bialkowski et al."""
-    solved_positions = np.full((len(slice_xy), 10, 2), np.nan)
-
-    nan_cols = np.argwhere(np.isnan(slice_xy).all(axis=0)).reshape(-1)
-    slice_nonan = np.delete(slice_xy, nan_cols, 1)
-    avg_positions = np.delete(avg_positions, nan_cols, 0)
-
-    for i, frame in enumerate(slice_nonan):
-        frame_nan = np.argwhere(np.isnan(frame)).reshape(-1)
-        frame_nonan = np.delete(frame, frame_nan)
-
-        cost_matrix = cdist(frame.reshape(-1, 2), avg_positions.reshape(-1, 2))
-        cost_matrix = np.where(np.isnan(cost_matrix), 1e6, cost_matrix)
-
-        row, col = linear_sum_assignment(cost_matrix)
-
-        solved_frame = np.full((10, 2), np.nan)
-        solved_frame[row] = frame.reshape(-1, 2)[col]
-        solved_positions[i] = solved_frame
-
-    return solved_positions
-
-
-def template_matching(avg_positions_scaled, templates):
-    """Template matching algorithm by Müller-Budack et al."""
-    scores = {}
-    for formation, coords in templates.items():
-        coords = np.array(coords)
-
-        form_min_x, form_max_x = np.nanmin(coords[:, 0]), np.nanmax(coords[:, 0])
-        form_min_y, form_max_y = np.nanmin(coords[:, 1]), np.nanmax(coords[:, 1])
-
-        scaled_form_x = (coords[:, 0] - form_min_x) / (form_max_x - form_min_x)
-        scaled_form_y = (coords[:, 1] - form_min_y) / (form_max_y - form_min_y)
-        scaled_form = np.column_stack((scaled_form_x, scaled_form_y))
-
-        cost_matrix = np.square(cdist(avg_positions_scaled, scaled_form))
-        row, col = linear_sum_assignment(cost_matrix)
-
-        cost = cost_matrix[row, col].mean()
-        scores[formation] = 1 - cost * 3
-
-    return scores
+from src.match_data import MatchPositions
+from src.formation import detect_formation
+from src.utils import read_phase_labels
+from src.constants import MATCH_NAMES, KICKOFF_OFFSETS
+from src.frame_selection import selection_from_phases, load_coverage, check_coverage
+from src.synchronisation import load_sync_offsets
+from src.prefetch import Prefetcher, file_size, visibility_file, load_visibility
 
 
 # === Main Script ===
@@ -83,25 +40,13 @@ def template_matching(avg_positions_scaled, templates):
 with open("./data/templates.json") as f:
     templates = json.load(f)
 
-# Load majority labels
-labels = pd.read_csv("./data/majority.csv")
-
-# Add timestamps in seconds
-labels["start_seconds"] = labels["start"].str[:2].astype(int) * 60 + labels["start"].str[3:5].astype(int)
-labels["end_seconds"] = labels["end"].str[:2].astype(int) * 60 + labels["end"].str[3:5].astype(int)
-
-# Define halves
-labels["half"] = "firstHalf"
-labels.loc[labels["start_seconds"] >= 45 * 60, "half"] = "secondHalf"
-labels.loc[labels['half'] == "secondHalf", 'start_seconds'] -= 45 * 60
-labels.loc[labels['half'] == "secondHalf", 'end_seconds'] -= 45 * 60
+# Load majority labels (timestamps in seconds within each half)
+labels = read_phase_labels("./data/majority.csv")
 
 # Split by match
 label_by_match = {
-    "DFL-MAT-0002UK": labels[labels["match"] == "Leverkusen - Gladbach"].reset_index(drop=True),
-    "DFL-MAT-0002YP": labels[labels["match"] == "Leverkusen - Bremen"].reset_index(drop=True),
-    "DFL-MAT-000303": labels[labels["match"] == "Bremen - Köln"].reset_index(drop=True),
-    "DFL-MAT-000322": labels[labels["match"] == "Leverkusen - Köln"].reset_index(drop=True)
+    match_id: labels[labels["match"] == match_name].reset_index(drop=True)
+    for match_id, match_name in MATCH_NAMES.items()
 }
 
 # Home/Away mapping
@@ -122,87 +67,98 @@ framerate = 25
 
 # Load position data
 path = "<PATH_TO_FILES>"
-match = "DFL-MAT-0002UK"
+matches = list(MATCH_NAMES)
 source = "SF"
+prefetch_bytes = 2 * 1024 ** 3  # budget for the input files (size on disk) of the current and prefetched matches
+visible_only = source in ["SF", "TV"]
 
+# Video/tracking frame offsets per half estimated by `estimate_sync_offsets.py`
+# (published offsets for halves without a reliable estimate)
 kickoff = {
-    "DFL-MAT-0002UK": {"firstHalf": 1695 - 1700, "secondHalf": 71593 - 71613},
-    "DFL-MAT-0002YP": {"firstHalf": 4927 - 4935, "secondHalf": 74898 - 74885},
-    "DFL-MAT-000303": {"firstHalf": 5669 - 5729, "secondHalf": 73869 - 73861},
-    "DFL-MAT-000322": {"firstHalf": 3982 - 4003, "secondHalf": 73036 - 73040}
+    match: load_sync_offsets(f"./data/sync_offsets/TV_{match}_offsets.json", default=KICKOFF_OFFSETS.get(match))
+    for match in matches
 }
 
-positions, _, _, teamsheet, pitch = read_position_data_xml(
-    f"{path}/Positions/{match}.xml",
-    f"{path}/Infos/{match}.xml"
-)
 
-if source in ["SF", "TV"]:
-    visible = jd.load(f"./data/player_visibility/{source}_{match}_visible_with_ballstatus.json")
+def input_files(match):
+    files = [f"{path}/Positions/{match}.xml", f"{path}/Infos/{match}.xml"]
+    if visible_only:
+        files.append(visibility_file("./data/", source, match))
+    return files
+
+
+def load_match(match):
+    """Loads the positions and visibility of a match into a float32 container (runs on a background thread).
+
+    The parsed positions are released team by team while they are copied into the container,
+    and the visibility is only loaded afterwards and kept as the container's mask, so the
+    prefetched inputs of a match are the container and the teamsheets.
+    """
+    positions, _, _, teamsheet, _ = read_position_data_xml(*input_files(match)[:2])
+    # phases are copied as float64 below, so the rankings are calculated in double precision
+    match_positions = MatchPositions.from_floodlight(positions, dtype=np.float32, release=True)
+    del positions
+
+    if visible_only:
+        visible = load_visibility("./data/", source, match)
 
-# Exclude goalkeepers
-gk_home_xID = int(teamsheet["Home"].teamsheet.loc[teamsheet["Home"].teamsheet["position"] == "TW", "xID"])
-gk_away_xID = int(teamsheet["Away"].teamsheet.loc[teamsheet["Away"].teamsheet["position"] == "TW", "xID"])
+        # The visibility has to cover all frames of the labelled phases
+        check_coverage(
+            selection_from_phases(label_by_match[match], kickoff[match], framerate=framerate),
+            load_coverage(visibility_file("./data/", source, match)),
+            {half: len(visible[half]["Home"]) for half in visible}, "Player visibility"
+        )
 
-for half in positions:
-    positions[half]["Home"].xy[:, 2 * gk_home_xID:2 * gk_home_xID + 2] = np.nan
-    positions[half]["Away"].xy[:, 2 * gk_away_xID:2 * gk_away_xID + 2] = np.nan
+        # applied lazily to the frames of each phase
+        match_positions.set_visibility(visible)
+        del visible
 
-# Apply visibility mask
-if source in ["SF", "TV"]:
-    for half in positions:
-        for team in positions[half]:
-            positions[half][team].x = np.where(visible[half][team] == 0, np.nan, positions[half][team].x)
-            positions[half][team].y = np.where(visible[half][team] == 0, np.nan, positions[half][team].y)
+    return {"positions": match_positions, "teamsheet": teamsheet}
 
-# Calculate team centroids
-centroids = {}
-for half in positions:
-    centroids.update({half: {}})
-    for team in positions[half]:
-        cm = CentroidModel()
-        cm.fit(positions[half][team])
-        centroids[half][team] = cm.centroid()
 
-# Get home/away names
-homeTeam = teamsheet["Home"].teamsheet["team"][0]
-awayTeam = teamsheet["Away"].teamsheet["team"][0]
+for match in label_by_match:
+    label_by_match[match]["predictions"] = None
 
-label_by_match[match]["predictions"] = None
+# Load inputs of the next match while the current match is processed
+for match, inputs in Prefetcher(matches, load_match, size_function=lambda m: file_size(*input_files(m)),
+                                max_bytes=prefetch_bytes):
+    match_positions, teamsheet = inputs["positions"], inputs["teamsheet"]
 
-# === Main Loop: Phase by Phase Detection ===
-for idx, row in label_by_match[match].iterrows():
-    start, end = row["start_seconds"], row["end_seconds"]
-    half = row["half"]
+    # Exclude goalkeepers
+    gk_home_xID = int(teamsheet["Home"].teamsheet.loc[teamsheet["Home"].teamsheet["position"] == "TW", "xID"])
+    gk_away_xID = int(teamsheet["Away"].teamsheet.loc[teamsheet["Away"].teamsheet["position"] == "TW", "xID"])
 
-    team_is_home = ((label_to_home[match][row["team"]] == "Home") and (row["possession"] == "in")) or \
-                   ((label_to_home[match][row["team"]] == "Away") and (row["possession"] == "out"))
-    in_pos = ["Away", "Home"][team_is_home]
+    for half in match_positions.halves:
+        match_positions.xy(half, "Home")[:, 2 * gk_home_xID:2 * gk_home_xID + 2] = np.nan
+        match_positions.xy(half, "Away")[:, 2 * gk_away_xID:2 * gk_away_xID + 2] = np.nan
 
-    start_frame = max(start * framerate + kickoff[match][half], 0)
-    end_frame = min(end * framerate + kickoff[match][half], len(positions[half]["Home"]))
+    # Get home/away names
+    homeTeam = teamsheet["Home"].teamsheet["team"][0]
+    awayTeam = teamsheet["Away"].teamsheet["team"][0]
 
-    slice = positions[half][in_pos].slice(start_frame, end_frame)
+    # === Main Loop: Phase by Phase Detection ===
+    for idx, row in label_by_match[match].iterrows():
+        start, end = row["start_seconds"], row["end_seconds"]
+        half = row["half"]
 
-    slice.rotate(rotation[direction[half][in_pos]])
+        team_is_home = ((label_to_home[match][row["team"]] == "Home") and (row["possession"] == "in")) or \
+                       ((label_to_home[match][row["team"]] == "Away") and (row["possession"] == "out"))
+        in_pos = ["Away", "Home"][team_is_home]
 
-    avg_pos = np.nanmean(slice.xy, axis=0)
-    solved_pos = role_assignment(slice.xy, avg_pos)
-    avg_pos_solved = np.nanmean(solved_pos, axis=0)
+        start_frame = max(start * framerate + kickoff[match][half], 0)
+        end_frame = min(end * framerate + kickoff[match][half], match_positions.n_frames[half])
 
-    # Normalize solved positions to match templates
-    min_x, max_x = np.nanmin(avg_pos_solved[:, 0]), np.nanmax(avg_pos_solved[:, 0])
-    min_y, max_y = np.nanmin(avg_pos_solved[:, 1]), np.nanmax(avg_pos_solved[:, 1])
-    scaled_x = (avg_pos_solved[:, 0] - min_x) / (max_x - min_x)
-    scaled_y = (avg_pos_solved[:, 1] - min_y) / (max_y - min_y)
-    scaled_xy = np.column_stack((scaled_x, scaled_y))
+        slice = match_positions.to_xy(
+            half, in_pos, visible_only=visible_only, startframe=start_frame, endframe=end_frame, dtype=np.float64
+        )
 
-    scaled_xy = scaled_xy[~np.isnan(scaled_xy).all(axis=1)]
+        slice.rotate(rotation[direction[half][in_pos]])
 
-    fsims = template_matching(scaled_xy, templates)
+        # Save top 5 formation candidates
+        label_by_match[match].at[idx, "predictions"] = detect_formation(slice.xy, templates, n=5)
 
-    # Save top 5 formation candidates
-    label_by_match[match].at[idx, "predictions"] = sorted(fsims.items(), key=lambda x: x[1], reverse=True)[:5]
+    # release the current match before the next one is handed over
+    del inputs, match_positions, teamsheet
 
 # Export
 labels = pd.concat(label_by_match.values())
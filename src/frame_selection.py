@@ -0,0 +1,201 @@
+"""
+frame_selection.py
+
+This module provides helper functions for frame selections, i.e. the frames of each half
+that downstream analyses actually read. Selections are passed upstream so that pitch
+intersections and player visibility are only computed for these frames.
+
+A selection is a dictionary {half: [[start_frame, end_frame], ...]} of sorted,
+non-overlapping frame ranges (end exclusive) that can be stored as JSON.
+
+- Creating selections from time ranges, ball status or labelled phases
+  (`selection_from_time_ranges`, `selection_from_ballstatus`, `selection_from_phases`).
+- Combining selections (`merge_selections`, `intersect_selections`).
+- Converting selections to frame masks (`selection_mask`).
+- Reading and writing selections (`save_frame_selection`, `load_frame_selection`).
+- Recording and checking the frames covered by partially computed result files
+  (`coverage_file`, `save_coverage`, `load_coverage`, `check_coverage`).
+
+Frames outside the selection are not computed (`None` intersections, NaN visibility). As
+these values have another meaning for computed frames (no field of view, player not on
+the pitch), every result file is accompanied by a `<name>_frames.json` file with the frames
+it covers, and consumers check that their frames are covered.
+"""
+
+import os
+import json
+import numpy as np
+
+
+def _mask_to_ranges(mask):
+    """Converts a boolean mask into a list of [start, end) ranges of consecutive True values."""
+    padded = np.concatenate([[False], np.asarray(mask, dtype=bool), [False]])
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    return [[int(start), int(end)] for start, end in zip(edges[::2], edges[1::2])]
+
+
+def _normalize_ranges(ranges):
+    """Sorts ranges, drops empty ones and merges overlapping or adjacent ones."""
+    merged = []
+    for start, end in sorted((max(int(start), 0), int(end)) for start, end in ranges):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def selection_from_time_ranges(time_ranges, framerate=25):
+    """Creates a selection from time ranges.
+
+    Parameters
+    ----------
+    time_ranges: dict
+        Dictionary {half: [(start_seconds, end_seconds), ...]}.
+    framerate: int
+        Framerate of the position data.
+
+    Returns
+    -------
+    selection: dict
+        Dictionary {half: [[start_frame, end_frame], ...]}.
+    """
+    return {
+        half: _normalize_ranges(
+            (int(round(start * framerate)), int(round(end * framerate))) for start, end in ranges
+        )
+        for half, ranges in time_ranges.items()
+    }
+
+
+def selection_from_ballstatus(ballstatus):
+    """Creates a selection of all frames in which the ball is in play.
+
+    Parameters
+    ----------
+    ballstatus: dict
+        Dictionary {half: Code} with ball status codes (1: in play, 0: out of play) as
+        returned by `read_position_data_xml`.
+    """
+    return {half: _mask_to_ranges(np.asarray(code.code) == 1) for half, code in ballstatus.items()}
+
+
+def selection_from_phases(labels, offsets, framerate=25):
+    """Creates a selection from labelled phases.
+
+    Parameters
+    ----------
+    labels: pd.DataFrame
+        Labelled phases of one match with the columns "half", "start_seconds" and
+        "end_seconds" (seconds within the half), e.g. as returned by `read_phase_labels`.
+    offsets: dict
+        Video/tracking frame offset per half, i.e. tracking frame = video frame + offset.
+    framerate: int
+        Framerate of the position data.
+    """
+    selection = {}
+    for half, phases in labels.groupby("half"):
+        selection[half] = _normalize_ranges(
+            (start * framerate + offsets[half], end * framerate + offsets[half])
+            for start, end in zip(phases["start_seconds"], phases["end_seconds"])
+        )
+    return selection
+
+
+def merge_selections(*selections):
+    """Returns the union of selections, i.e. all frames selected by at least one of them."""
+    merged = {}
+    for selection in selections:
+        for half, ranges in selection.items():
+            merged[half] = _normalize_ranges(merged.get(half, []) + [list(r) for r in ranges])
+    return merged
+
+
+def intersect_selections(*selections):
+    """Returns the intersection of selections, i.e. all frames selected by each of them."""
+    halves = set.intersection(*(set(selection) for selection in selections))
+    intersection = {}
+    for half in halves:
+        n_frames = max(end for selection in selections for _, end in selection[half] or [(0, 0)])
+        mask = np.ones(n_frames, dtype=bool)
+        for selection in selections:
+            mask &= selection_mask(selection, half, n_frames)
+        intersection[half] = _mask_to_ranges(mask)
+    return intersection
+
+
+def selection_mask(selection, half, n_frames):
+    """Converts the selection of a half into a boolean mask of length `n_frames`.
+    If `selection` is None, all frames are selected."""
+    if selection is None:
+        return np.ones(n_frames, dtype=bool)
+    mask = np.zeros(n_frames, dtype=bool)
+    for start, end in selection.get(half, []):
+        mask[start:end] = True
+    return mask
+
+
+def save_frame_selection(selection, file):
+    """Writes a selection to a JSON file."""
+    with open(file, "w") as f:
+        json.dump(selection, f)
+
+
+def load_frame_selection(file):
+    """Reads a selection from a JSON file."""
+    with open(file) as f:
+        return {half: [list(r) for r in ranges] for half, ranges in json.load(f).items()}
+
+
+def coverage_file(file):
+    """Returns the file storing the frames covered by a result file."""
+    return f"{os.path.splitext(file)[0]}_frames.json"
+
+
+def save_coverage(selection, file, n_frames):
+    """Writes the frames covered by a result file next to it.
+
+    Parameters
+    ----------
+    selection: dict or None
+        Selection of the computed frames (None: all frames).
+    file: str
+        Result file, e.g. the pitch intersections of a match.
+    n_frames: dict
+        Number of frames per half.
+    """
+    if selection is None:
+        selection = {half: [[0, int(T)]] for half, T in n_frames.items()}
+    save_frame_selection(selection, coverage_file(file))
+
+
+def load_coverage(file):
+    """Reads the frames covered by a result file (None: all frames, e.g. for the published
+    files that were computed without a selection)."""
+    if not os.path.exists(coverage_file(file)):
+        return None
+    return load_frame_selection(coverage_file(file))
+
+
+def check_coverage(required, covered, n_frames, name="Input"):
+    """Raises a ValueError if `required` selects frames that are not `covered`.
+
+    Parameters
+    ----------
+    required, covered: dict or None
+        Selections of the frames read by a consumer and of the frames computed upstream
+        (None: all frames).
+    n_frames: dict
+        Number of frames per half.
+    name: str
+        Name of the input used in the error message.
+    """
+    for half, T in n_frames.items():
+        missing = selection_mask(required, half, T) & ~selection_mask(covered, half, T)
+        if missing.any():
+            raise ValueError(
+                f"{name} not computed for {int(missing.sum())} required frames of {half} "
+                f"(first: {int(np.argmax(missing))}), rerun it with a frame selection covering these frames"
+            )
@@ -0,0 +1,60 @@
+"""
+generate_frame_selection.py
+
+This script collects the frames that are read by the downstream analyses of a match:
+
+- Experiment 1 — Intensity (`calculate_intensity_metrics.py`): first 45 minutes of each half.
+- Experiment 2 — Formation Detection (`formation_detection.py`): labelled possession phases.
+
+Every experiment declares all frames it reads. Both experiments also read frames in which
+the ball is out of play (intensity: active/inactive visibility, formation detection: full
+phases), so the selection is not restricted to ball-in-play frames (cf. `selection_from_ballstatus`
+for analyses that only read those).
+The output is a JSON file with frame ranges per half (`data/frame_selection/`, created if
+missing) that is passed to `generate_pitch_intersections.py` and `generate_player_visibility.py`,
+so that projection and visibility are only computed for frames that are actually used. Both experiments check
+that the visibility they load covers their frames.
+"""
+
+import os
+
+from src.utils import read_phase_labels
+from src.constants import MATCH_NAMES, KICKOFF_OFFSETS
+from src.synchronisation import load_sync_offsets
+from src.frame_selection import (
+    selection_from_time_ranges, selection_from_phases, merge_selections, save_frame_selection
+)
+
+# === Settings ===
+base_path = "./data/"
+match_id = "DFL-MAT-0002UK"
+framerate = 25
+sync_offsets_file = f"{base_path}sync_offsets/TV_{match_id}_offsets.json"  # see `estimate_sync_offsets.py`
+experiments = ["intensity", "formation"]  # downstream analyses to collect frames for
+output_path = f"{base_path}frame_selection/"
+
+os.makedirs(output_path, exist_ok=True)
+
+selections = []
+
+# Experiment 1: first 45 minutes of each half
+if "intensity" in experiments:
+    selections.append(selection_from_time_ranges(
+        {"firstHalf": [(0, 45 * 60)], "secondHalf": [(0, 45 * 60)]}, framerate=framerate
+    ))
+
+# Experiment 2: labelled possession phases
+if "formation" in experiments:
+    labels = read_phase_labels(f"{base_path}majority.csv")
+    offsets = load_sync_offsets(sync_offsets_file, default=KICKOFF_OFFSETS.get(match_id))
+    selections.append(selection_from_phases(
+        labels[labels["match"] == MATCH_NAMES[match_id]], offsets, framerate=framerate
+    ))
+
+frame_selection = merge_selections(*selections)
+
+for half, ranges in frame_selection.items():
+    print(f"{half}: {sum(end - start for start, end in ranges)} frames in {len(ranges)} ranges")
+
+# Save result as .json
+save_frame_selection(frame_selection, f"{output_path}{match_id}_selection.json")
@@ -7,16 +7,17 @@ The output is a JSON file containing frame-wise pitch polygons,
 which are used for player visibility masking.
 """
 
+import os
 import warnings
 import numpy as np
-import pandas as pd
 import jdata as jd
 from shapely.geometry import Polygon as Pol
-from scipy.signal import savgol_filter
 from alive_progress import alive_bar
 
-from src.utils import vid2pos_reader, generate_topview_mask, mask2pitchpolygon
-from src.constants import MATCH_LENGTH
+from src.utils import vid2pos_reader, homography_series, CoherentFovProjector
+from src.constants import MATCH_LENGTH, KICKOFF_OFFSETS
+from src.synchronisation import load_sync_offsets
+from src.frame_selection import load_frame_selection, selection_mask, save_coverage
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
@@ -25,6 +26,9 @@ warnings.filterwarnings("ignore")
 base_path = "./data/"
 match_id = "DFL-MAT-0002UK"
 video_source = "TV"
+frame_selection_file = None  # e.g. f"{base_path}frame_selection/{match_id}_selection.json" (None: all frames)
+sync_offsets_file = f"{base_path}sync_offsets/{video_source}_{match_id}_offsets.json"  # see `estimate_sync_offsets.py`
+reuse_tolerance = 0.1  # max. corner displacement in metres for reusing the previous polygon (0: project every frame)
 
 # Define file paths for homography data
 file_first_half = f"{video_source}_S_{match_id}_H0_filtered.jsonl"
@@ -36,46 +40,27 @@ homography_data = {
     "secondHalf": vid2pos_reader(f"{base_path}homography_matrices/{file_second_half}")
 }
 
-# Filter out invalid entries
-for half in homography_data:
-    homography_data[half] = [
-        frame for frame in homography_data[half] if frame["homography"][0][0] is not None
-    ]
+# Video/tracking offsets per half (without estimated offsets the first valid homography is
+# aligned with the first tracking frame, as for the published pitch intersections)
+sync_offsets = {}
+if os.path.exists(sync_offsets_file):
+    sync_offsets = load_sync_offsets(sync_offsets_file, default=KICKOFF_OFFSETS.get(match_id))
 
-# Extract offset frame numbers
-frame_offset = {
-    "firstHalf": homography_data["firstHalf"][0]["frame_number_refs"],
-    "secondHalf": homography_data["secondHalf"][0]["frame_number_refs"]
-}
-
-# Initialize homography matrices (as NaN arrays)
-homography_matrices = {
-    half: np.full((MATCH_LENGTH[match_id][half], 3, 3), np.nan)
-    for half in homography_data
-}
+# Load frame selection, i.e. the frames read by downstream analyses
+frame_selection = load_frame_selection(frame_selection_file) if frame_selection_file else None
 
 print("Extract and convert homography matrices...")
 
-for half in homography_matrices:
-    # Fill known homographies
-    for frame in homography_data[half]:
-        row_idx = frame["frame_number_refs"] - frame_offset[half]
-        homography_matrices[half][row_idx] = np.array(frame["homography"])
-
-    # Interpolate missing values (up to 25 frames)
-    for i in range(3):
-        for j in range(3):
-            homography_matrices[half][:, i, j] = pd.Series(
-                homography_matrices[half][:, i, j]
-            ).interpolate("linear", limit=25, limit_direction="both")
-
-    # Smooth homography matrices using Savitzky-Golay filter
-    homography_matrices[half] = savgol_filter(
-        homography_matrices[half], window_length=31, polyorder=3, axis=0, mode="nearest"
-    )
-
-    # Convert to list of matrices
-    homography_matrices[half] = list(homography_matrices[half])
+# Interpolate (up to 25 frames) and smooth homography matrices, then convert to list of matrices
+# indexed by tracking frame (tracking frame = video frame + offset).
+# This is done for the full halves, so selected frames at range borders are interpolated and
+# smoothed with the same neighbouring frames as without a selection.
+homography_matrices = {}
+for half in homography_data:
+    first_frame = -sync_offsets[half] if half in sync_offsets else None
+    homography_matrices[half] = list(homography_series(
+        homography_data[half], MATCH_LENGTH[match_id][half], first_frame=first_frame
+    )[0])
 
 # Define camera and pitch bounds
 camera_bounds = np.array([[0, 0], [0, 720], [1280, 720], [1280, 0]])
@@ -87,14 +72,21 @@ pitch_polygon = Pol([(0, 0), (105, 0), (105, 68), (0, 68)])
 pitch_intersections = {half: [] for half in homography_matrices}
 target_scale = 1  # Scale of the top-view projection
 
-# Generate polygons for each frame
+# Generate polygons for each selected frame (None for frames that are not selected, see the
+# `_frames.json` file saved with the result).
+# Polygons are reused while the camera is nearly static (see `CoherentFovProjector`).
 for half in homography_matrices:
-    with alive_bar(len(homography_matrices[half]), force_tty=True) as bar:
-        for homography in homography_matrices[half]:
-            mask = generate_topview_mask(homography, target_scale=target_scale).numpy()
-            polygon = mask2pitchpolygon(np.round(mask), target_scale)
+    selected = selection_mask(frame_selection, half, len(homography_matrices[half]))
+    projector = CoherentFovProjector(tolerance=reuse_tolerance, target_scale=target_scale)
+    with alive_bar(int(selected.sum()), force_tty=True) as bar:
+        for homography, is_selected in zip(homography_matrices[half], selected):
+            if not is_selected:
+                pitch_intersections[half].append(None)
+                continue
+            polygon = projector(homography)
             pitch_intersections[half].append(polygon)
             bar()
+    print(f"{half}: reused {projector.reuse_rate:.1%} of polygons, max. error {projector.max_error:.3f} m")
 
 # Convert Shapely Polygons to arrays of (x, y) coordinates
 for half in pitch_intersections:
@@ -106,3 +98,4 @@ for half in pitch_intersections:
 # Save result as .json
 output_path = f"{base_path}pitch_intersections/{video_source}_{match_id}_intersection.json"
 jd.save(pitch_intersections, output_path)
+save_coverage(frame_selection, output_path, MATCH_LENGTH[match_id])
@@ -23,17 +23,27 @@ Precomputed pitch intersection files (`pitch_intersections/`) are provided in th
 import jdata as jd
 import numpy as np
 from floodlight import XY
-from shapely.geometry import Point, Polygon
 from alive_progress import alive_bar
 
+from src.utils import player_visibility
 from src.constants import MATCH_LENGTH, POSITIONS_4231, POSITIONS_352
+from src.frame_selection import load_frame_selection, selection_mask, save_coverage, load_coverage, check_coverage
 
 # Match details
 source = "TV"
 match_id = "DFL-MAT-0002UK"
+frame_selection_file = None  # e.g. f"./data/frame_selection/{match_id}_selection.json" (None: all frames)
 
 # Load precomputed pitch intersections
-intersections = jd.load(f"./data/pitch_intersections/{source}_{match_id}_intersection.json")
+intersections_file = f"./data/pitch_intersections/{source}_{match_id}_intersection.json"
+intersections = jd.load(intersections_file)
+
+# Load frame selection, i.e. the frames read by downstream analyses
+frame_selection = load_frame_selection(frame_selection_file) if frame_selection_file else None
+
+# Intersections of frames that were not projected are None as well, which would mark all players
+# as not visible. Therefore, all selected frames have to be covered by the projection.
+check_coverage(frame_selection, load_coverage(intersections_file), MATCH_LENGTH[match_id], "Pitch intersections")
 
 # Formations for both teams (home: 4-2-3-1, away: 3-5-2)
 home_formation = np.array(POSITIONS_4231)
@@ -51,46 +61,20 @@ dummy_positions = {
     }
 }
 
-# Initialize visibility mask (1: visible, 0: not visible)
-visibility = {
-    half: {
-        team: np.ones((MATCH_LENGTH[match_id][half], dummy_positions[half][team].N))
-        for team in dummy_positions[half]
-    }
-    for half in dummy_positions
-}
-
 # Determine player visibility by checking if within the camera-view polygon
+# (1: visible, 0: not visible, NaN: no position or frame not selected)
+visibility = {half: {} for half in dummy_positions}
 for half in dummy_positions:
     for team in dummy_positions[half]:
         print(f"Processing {half} - {team}")
-        with alive_bar(len(dummy_positions[half][team]), force_tty=True) as bar:
-            for frame_idx, frame in enumerate(dummy_positions[half][team]):
-                polygon_coords = intersections[half][frame_idx]
-
-                # Skip frame if intersection polygon is not available
-                if polygon_coords is None:
-                    visibility[half][team][frame_idx, :] = 0
-                    continue
-
-                # Create shapely Polygon from (x, y) coords
-                pitch_polygon = Polygon(zip(polygon_coords[0], polygon_coords[1]))
-
-                # CCheck if each player's position lies within the field of view polygon
-                for player_idx, (x, y) in enumerate(zip(frame[::2], frame[1::2])):
-                    if not np.isnan((x, y)).any():
-                        player_point = Point(x, y)
-                        if not player_point.within(pitch_polygon):
-                            visibility[half][team][frame_idx, player_idx] = 0
-                bar()
-
-        # Mask visibility array where player positions are NaN
-        visibility[half][team] = np.where(
-            np.isnan(dummy_positions[half][team].x),
-            np.nan,
-            visibility[half][team]
-        )
+        selected = selection_mask(frame_selection, half, len(dummy_positions[half][team]))
+        with alive_bar(int(selected.sum()), force_tty=True) as bar:
+            # Polygons reused by the projection stage have identical coords and are reused here
+            visibility[half][team] = player_visibility(
+                dummy_positions[half][team], intersections[half], frames=selected, progress=bar
+            )
 
 # Save the visibility dictionary
 output_path = f"./data/player_visibility/{source}_{match_id}_visible_dummy.json"
 jd.save(visibility, output_path)
+save_coverage(frame_selection, output_path, MATCH_LENGTH[match_id])
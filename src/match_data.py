@@ -0,0 +1,132 @@
+"""
+match_data.py
+
+This module provides a compact in-memory container for the position data of a match
+(`MatchPositions`).
+
+All halves and teams are stored in one contiguous float32 (optionally float64) block.
+Positions of a single half and team are exposed as NumPy views, and player visibility
+is stored as a boolean mask that is only applied when a masked copy is requested.
+"""
+
+import numpy as np
+from floodlight import XY
+
+
+class MatchPositions:
+    """Container for the positions of all halves and teams of a match.
+
+    Parameters
+    ----------
+    n_frames: dict
+        Number of frames per half, e.g. {"firstHalf": 67500, "secondHalf": 67500}.
+    n_players: dict
+        Number of players per team, e.g. {"Home": 20, "Away": 20}.
+    framerate: int
+        Framerate of the position data.
+    dtype: np.dtype
+        Data type of the position block, np.float32 (default) or np.float64.
+    empty: bool
+        If True, the position block is not initialised with NaN, so its memory is only
+        committed when the views are written. Use this only if every view is filled
+        right away, e.g. while copying (and releasing) parsed positions team by team.
+    """
+
+    def __init__(self, n_frames, n_players, framerate=25, dtype=np.float32, empty=False):
+        self.framerate = framerate
+        self.n_frames = dict(n_frames)
+        self.n_players = dict(n_players)
+
+        n_total = sum(self.n_frames.values())
+        n_columns = sum(self.n_players.values())
+        if empty:
+            self._data = np.empty(n_total * n_columns * 2, dtype=dtype)
+        else:
+            self._data = np.full(n_total * n_columns * 2, np.nan, dtype=dtype)
+        self._hidden = np.zeros(n_total * n_columns, dtype=bool)
+
+        # views (T x 2N) and (T x N) per half and team, each contiguous in the blocks
+        self._xy, self._mask = {}, {}
+        offset = 0
+        for half, T in self.n_frames.items():
+            self._xy[half], self._mask[half] = {}, {}
+            for team, N in self.n_players.items():
+                self._xy[half][team] = self._data[2 * offset:2 * (offset + T * N)].reshape(T, 2 * N)
+                self._mask[half][team] = self._hidden[offset:offset + T * N].reshape(T, N)
+                offset += T * N
+
+    @classmethod
+    def from_floodlight(cls, positions, teams=("Home", "Away"), dtype=np.float32, release=False, endframe=None):
+        """Creates a container from a dictionary {half: {team: XY}} as returned by
+        `read_position_data_xml`. Teams not listed in `teams` (e.g. "Ball") are skipped and
+        with `endframe`, only the first `endframe` frames of each half are stored.
+
+        With `release`, the XY objects in `positions` are replaced by None as soon as they
+        are no longer needed (skipped teams first, then each team after it is copied), so that
+        the peak memory is the container plus a single team instead of twice the positions.
+        """
+        halves = list(positions)
+        match = cls(
+            n_frames={half: len(positions[half][teams[0]].xy[:endframe]) for half in halves},
+            n_players={team: positions[halves[0]][team].N for team in teams},
+            framerate=positions[halves[0]][teams[0]].framerate,
+            dtype=dtype,
+            empty=True
+        )
+        if release:
+            for half in halves:
+                for team in positions[half]:
+                    if team not in teams:
+                        positions[half][team] = None
+        for half in halves:
+            for team in teams:
+                match.xy(half, team)[:] = positions[half][team].xy[:endframe]
+                if release:
+                    positions[half][team] = None
+
+        return match
+
+    @property
+    def halves(self):
+        return list(self.n_frames)
+
+    @property
+    def teams(self):
+        return list(self.n_players)
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes + self._hidden.nbytes
+
+    def xy(self, half, team):
+        """Returns a (T x 2N) view of the positions, i.e. changes are written to the container."""
+        return self._xy[half][team]
+
+    def hidden(self, half, team):
+        """Returns a (T x N) view of the mask of frames where players are not visible."""
+        return self._mask[half][team]
+
+    def set_visibility(self, visible):
+        """Sets the visibility mask from a dictionary {half: {team: np.ndarray (T x N)}}
+        with 1 (visible), 0 (not visible) and NaN (no position) entries."""
+        for half in self.halves:
+            for team in self.teams:
+                self._mask[half][team][:] = np.asarray(visible[half][team]) == 0
+
+    def to_xy(self, half, team, visible_only=False, startframe=None, endframe=None, copy=False, dtype=None):
+        """Returns a floodlight XY object for the given half, team and frame range.
+
+        Without `visible_only`, `copy` or `dtype`, the XY object wraps a view of the container
+        (i.e. in-place transforms such as `XY.rotate` modify the container). Otherwise,
+        a copy of the requested frames (cast to `dtype`, e.g. np.float64 for calculations
+        on a float32 container) is returned in which, with `visible_only`, positions of
+        players that are not visible are set to NaN.
+        """
+        xy = self._xy[half][team][startframe:endframe]
+        if visible_only or copy or dtype is not None:
+            xy = xy.astype(dtype or xy.dtype)
+        if visible_only:
+            hidden = self._mask[half][team][startframe:endframe]
+            xy.reshape(len(xy), -1, 2)[hidden] = np.nan
+
+        return XY(xy=xy, framerate=self.framerate)
@@ -0,0 +1,155 @@
+"""
+prefetch.py
+
+This module provides helpers for multi-match runs that load the inputs of upcoming
+matches on background threads while the current match is processed:
+
+- Prefetching job inputs in job order with a bounded memory budget (`Prefetcher`).
+- Estimating the memory budget of a job from the size of its input files (`file_size`).
+- Loading the homography and visibility files of a match (`load_homographies`, `visibility_file`,
+  `load_visibility`).
+"""
+
+import os
+import threading
+import jdata as jd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import vid2pos_reader
+
+
+def file_size(*files):
+    """Returns the total size of the given files in bytes (missing files count as 0)."""
+    return sum(os.path.getsize(file) for file in files if os.path.exists(file))
+
+
+def load_homographies(base_path, video_source, match_id):
+    """Reads the vid2pos output of both halves of a match.
+
+    Returns
+    -------
+    homography_data: dict
+        Dictionary {half: List of dict} as returned by `vid2pos_reader`.
+    """
+    return {
+        half: vid2pos_reader(f"{base_path}homography_matrices/{video_source}_S_{match_id}_H{i}_filtered.jsonl")
+        for i, half in enumerate(["firstHalf", "secondHalf"])
+    }
+
+
+def visibility_file(base_path, source, match_id):
+    """Returns the path of the player visibility file of a match."""
+    return f"{base_path}player_visibility/{source}_{match_id}_visible_with_ballstatus.json"
+
+
+def load_visibility(base_path, source, match_id):
+    """Reads the player visibility of a match as saved by the visibility stage.
+
+    Returns
+    -------
+    visible: dict
+        Dictionary {half: {team: np.ndarray (T x N)}}.
+    """
+    return jd.load(visibility_file(base_path, source, match_id))
+
+
+class Prefetcher:
+    """Iterates over jobs and their inputs, loading inputs of upcoming jobs in the background.
+
+    Jobs are yielded in their original order. Inputs of the following jobs are loaded while
+    the current job is processed, as long as the estimated memory of the current job and all
+    prefetched jobs stays within `max_bytes`, i.e. `max_bytes` minus the current job is kept
+    in flight. Inputs are reserved from the submission of their job until the caller requests
+    the next job, so the inputs held by the caller while it processes a job count towards the
+    budget. The next job is always loaded when it is requested, even if it exceeds the budget.
+
+    The budget is only as accurate as `size_function`. File sizes on disk (`file_size`) are a
+    heuristic: parsed XML and JSON files usually occupy several times their file size in
+    memory, so `max_bytes` has to be chosen with some headroom.
+
+    Parameters
+    ----------
+    jobs: list
+        Jobs, e.g. match ids.
+    load_function: callable
+        Function returning the inputs of a job, e.g. a dict with positions and homographies.
+    size_function: callable, optional
+        Function returning the estimated memory of the inputs of a job in bytes, e.g. based
+        on `file_size`. Defaults to 0, i.e. only `max_pending` limits prefetching.
+    max_bytes: int
+        Budget in bytes (in units of `size_function`) of the inputs of the current and the
+        prefetched jobs.
+    max_pending: int
+        Maximum number of jobs loaded ahead of the current job.
+    max_workers: int
+        Number of loader threads.
+
+    Examples
+    --------
+    >>> for match_id, inputs in Prefetcher(match_ids, load_match, size_function=match_size):
+    ...     process(match_id, inputs)
+    """
+
+    def __init__(self, jobs, load_function, size_function=None, max_bytes=2 * 1024 ** 3, max_pending=2,
+                 max_workers=2):
+        self.jobs = list(jobs)
+        self.load_function = load_function
+        self.size_function = size_function or (lambda job: 0)
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.max_workers = max_workers
+
+        self.reserved_bytes = 0
+        self.peak_reserved_bytes = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, size):
+        with self._lock:
+            self.reserved_bytes += size
+            self.peak_reserved_bytes = max(self.peak_reserved_bytes, self.reserved_bytes)
+
+    def _release(self, size):
+        with self._lock:
+            self.reserved_bytes -= size
+
+    def __iter__(self):
+        pending = deque()
+        next_job = 0
+        current_size = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            def submit(size):
+                nonlocal next_job
+                job = self.jobs[next_job]
+                self._reserve(size)
+                pending.append((job, size, executor.submit(self.load_function, job)))
+                next_job += 1
+
+            try:
+                while next_job < len(self.jobs) or pending:
+                    # the caller is done with the previous job when it requests the next one
+                    self._release(current_size)
+                    current_size = 0
+
+                    # the requested job is always loaded, even if it exceeds the budget
+                    if not pending:
+                        submit(self.size_function(self.jobs[next_job]))
+                    job, current_size, future = pending.popleft()
+
+                    # prefetch the following jobs while the budget allows (including the current job)
+                    while next_job < len(self.jobs) and len(pending) < self.max_pending:
+                        size = self.size_function(self.jobs[next_job])
+                        if self.reserved_bytes + size > self.max_bytes:
+                            break
+                        submit(size)
+
+                    inputs = future.result()
+                    yield job, inputs
+                    del inputs
+            finally:
+                # release the current and prefetched jobs if the caller stops early
+                self._release(current_size + sum(size for _, size, _ in pending))
+                for _, _, future in pending:
+                    future.cancel()
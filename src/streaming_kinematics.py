@@ -0,0 +1,208 @@
+"""
+streaming_kinematics.py
+
+This module provides a chunked kinematics pipeline for long or high-frequency position
+data, whose memory is bounded by the chunk size instead of the length of the data:
+
+- Deriving the overlap from the decay of the filter's impulse response (`filter_overlap`).
+- Iterating over fixed-size chunks with overlap padding (`iter_chunks`).
+- Filtering positions and calculating per-frame distances and speeds chunk by chunk
+  (`iter_kinematics`).
+- Accumulating total distances and distances per speed zone (`SpeedZoneAccumulator`,
+  `streaming_kinematics`).
+
+Each chunk is filtered together with `overlap` frames on both sides, which are discarded
+afterwards. By default, the overlap spans the frames until the impulse response of the
+Butterworth filter has decayed to `tol` of its peak, so the results match `butterworth_lowpass`, `DistanceModel` and `VelocityModel` (central
+differences) applied to the whole array up to floating point precision.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import scipy.signal
+from floodlight import XY
+from floodlight.transforms.filter import butterworth_lowpass
+
+
+def filter_overlap(framerate, order=3, Wn=1, tol=1e-12):
+    """Returns the number of frames needed on both sides of a chunk for `butterworth_lowpass`.
+
+    The transient caused by cutting the signal decays like the impulse response of the
+    Butterworth filter, so the overlap is the number of frames until the impulse response
+    stays below `tol` times its peak, plus the padding of `scipy.signal.filtfilt`.
+
+    Parameters
+    ----------
+    framerate: int
+        Framerate of the position data.
+    order, Wn:
+        Parameters of `butterworth_lowpass`.
+    tol: float
+        Remaining amplitude of the impulse response relative to its peak.
+
+    Returns
+    -------
+    overlap: int
+        Number of frames.
+    """
+    b, a = scipy.signal.butter(order, Wn, btype="lowpass", output="ba", fs=framerate)
+    padlen = 3 * max(len(a), len(b))
+
+    n_frames = int(np.ceil(10 * framerate / Wn))
+    while True:
+        impulse = np.zeros(n_frames)
+        impulse[0] = 1.
+        response = np.abs(scipy.signal.lfilter(b, a, impulse))
+        above = np.flatnonzero(response >= tol * response.max())
+        if above[-1] < n_frames - 1:
+            return int(above[-1]) + 1 + padlen
+        n_frames *= 2
+
+
+def iter_chunks(n_frames, chunk_size, overlap):
+    """Yields chunk boundaries.
+
+    Returns
+    -------
+    start, end, window_start, window_end: int
+        Frames [start, end) of the chunk and [window_start, window_end) of the chunk
+        including the overlap on both sides (clipped to the data).
+    """
+    for start in range(0, n_frames, chunk_size):
+        end = min(start + chunk_size, n_frames)
+        yield start, end, max(start - overlap, 0), min(end + overlap, n_frames)
+
+
+def iter_kinematics(
+        xy, framerate, chunk_size=15000, overlap=None, hidden=None, shift=None, lowpass=True, order=3, Wn=1
+):
+    """Filters positions and calculates per-frame distances and speeds chunk by chunk.
+
+    Parameters
+    ----------
+    xy: array-like
+        Positions (T x 2N) supporting slicing along the first axis, e.g. a NumPy array or
+        memmap, an h5py dataset or a view of `MatchPositions`. Only the frames of the
+        current chunk (and its overlap) are read at a time.
+    framerate: int
+        Framerate of the position data.
+    chunk_size: int
+        Number of frames per chunk.
+    overlap: int, optional
+        Number of frames filtered on both sides of each chunk. Defaults to
+        `filter_overlap(framerate, order, Wn)`; a smaller overlap raises a warning, as the
+        results then differ from filtering the whole array.
+    hidden: array-like, optional
+        Mask (T x N) of players that are not visible. Their positions are set to NaN
+        after filtering, as in `calculate_intensity_metrics.py`.
+    shift: tuple, optional
+        Shift vector (x, y) applied with `XY.translate` after filtering, as in
+        `calculate_intensity_metrics.py`.
+    lowpass: bool
+        Whether positions are filtered with `butterworth_lowpass`.
+    order, Wn:
+        Parameters of `butterworth_lowpass`.
+
+    Yields
+    ------
+    start, end: int
+        Frames [start, end) of the chunk.
+    xy_filtered: np.ndarray
+        Filtered positions (end - start x 2N).
+    distance: np.ndarray
+        Distance covered per frame (end - start x N), as `DistanceModel.distance_covered()`.
+    speed: np.ndarray
+        Speed per frame (end - start x N), as `VelocityModel.velocity()`.
+    """
+    n_frames = len(xy)
+    required_overlap = filter_overlap(framerate, order=order, Wn=Wn) if lowpass else 1
+    if overlap is None:
+        overlap = required_overlap
+    elif overlap < required_overlap:
+        warnings.warn(
+            f"An overlap of {overlap} frames is shorter than the decay of the filter ({required_overlap} frames), "
+            f"so the chunked results differ from filtering the whole array."
+        )
+
+    for start, end, window_start, window_end in iter_chunks(n_frames, chunk_size, overlap):
+        window = np.array(xy[window_start:window_end], dtype=float)
+        if lowpass:
+            window = butterworth_lowpass(XY(window, framerate=framerate), order=order, Wn=Wn).xy
+        if shift is not None:
+            window_xy = XY(window, framerate=framerate)
+            window_xy.translate(shift)
+            window = window_xy.xy
+        if hidden is not None:
+            hidden_window = np.asarray(hidden[window_start:window_end], dtype=bool)
+            window.reshape(len(window), -1, 2)[hidden_window] = np.nan
+
+        # central differences need one neighbouring frame on both sides of the chunk
+        diff_start, diff_end = max(start - 1, window_start), min(end + 1, window_end)
+        differences = np.gradient(window[diff_start - window_start:diff_end - window_start], axis=0)
+        differences = differences[start - diff_start:start - diff_start + end - start]
+
+        distance = np.hypot(differences[:, ::2], differences[:, 1::2])
+        speed = np.multiply(distance, framerate)
+
+        yield start, end, window[start - window_start:end - window_start], distance, speed
+
+
+class SpeedZoneAccumulator:
+    """Accumulates the total distance and the distance per speed zone of each player.
+
+    Parameters
+    ----------
+    n_players: int
+        Number of players.
+    speed_zones: list
+        List of (min_speed, max_speed) tuples in m/s, as in `distance_covered_per_zone`.
+    speed_zone_names: list, optional
+        Names of the speed zones.
+    """
+
+    def __init__(self, n_players, speed_zones=(), speed_zone_names=None):
+        self.speed_zones = list(speed_zones)
+        if speed_zone_names is None:
+            speed_zone_names = [f"{min_speed} to {max_speed}" for min_speed, max_speed in self.speed_zones]
+        self.speed_zone_names = speed_zone_names
+        self.n_frames = 0
+        self.distance = np.zeros(n_players)
+        self.distance_per_zone = np.zeros((n_players, len(self.speed_zones)))
+
+    def update(self, distance, speed):
+        """Adds per-frame distances and speeds (T x N) of a chunk."""
+        self.n_frames += len(distance)
+        self.distance += np.nansum(distance, axis=0)
+        for i, (min_speed, max_speed) in enumerate(self.speed_zones):
+            speed_mask = np.bitwise_and(speed >= min_speed, speed < max_speed)
+            self.distance_per_zone[:, i] += np.nansum(np.where(speed_mask, distance, 0.), axis=0)
+
+    def zones(self):
+        """Returns the distance per speed zone as a DataFrame (as `distance_covered_per_zone`)."""
+        return pd.DataFrame(data=self.distance_per_zone, columns=self.speed_zone_names)
+
+
+def streaming_kinematics(xy, framerate, speed_zones=(), speed_zone_names=None, **kwargs):
+    """Calculates total distances and distances per speed zone chunk by chunk.
+
+    Parameters
+    ----------
+    xy, framerate:
+        See `iter_kinematics`.
+    speed_zones, speed_zone_names:
+        See `SpeedZoneAccumulator`.
+    kwargs:
+        Further arguments of `iter_kinematics` (e.g. `chunk_size`, `overlap`, `hidden`, `shift`).
+
+    Returns
+    -------
+    accumulator: SpeedZoneAccumulator
+        Accumulated distances of all players.
+    """
+    accumulator = SpeedZoneAccumulator(np.shape(xy)[1] // 2, speed_zones, speed_zone_names)
+    for _, _, _, distance, speed in iter_kinematics(xy, framerate, **kwargs):
+        accumulator.update(distance, speed)
+
+    return accumulator
@@ -0,0 +1,216 @@
+"""
+synchronisation.py
+
+This module provides helper functions for estimating the frame offset between the
+broadcast video (homography series) and the tracking data:
+
+- Deriving the camera pan from a homography series (`camera_pan_signal`).
+- Deriving the horizontal motion of the ball or the team centroid (`tracking_motion_signal`).
+- Estimating the offset of two signals with FFT-based cross-correlation (`estimate_sync_offset`).
+- Estimating the offsets for all halves of a match (`estimate_sync_offsets`).
+- Reading estimated offsets with a fallback for unreliable halves (`load_sync_offsets`).
+
+Offsets follow the convention of `KICKOFF_OFFSETS` in `constants.py`, i.e.
+tracking frame = video frame (`frame_number_refs`) + offset.
+"""
+
+import os
+import json
+import numpy as np
+from scipy.signal import correlate, correlation_lags
+
+
+def camera_pan_signal(homography_matrices, image_size=(720, 1280), max_abs_x=60.):
+    """Calculates the pitch x-coordinate of the image center for every frame.
+
+    Parameters
+    ----------
+    homography_matrices: np.ndarray
+        Array of shape (T, 3, 3) mapping image to (centered) pitch coordinates, e.g. as
+        returned by `homography_series`.
+    image_size: tuple
+        Height and width of the video frames in pixels.
+    max_abs_x: float
+        Projections further away from the pitch center (e.g. above the horizon) are
+        considered invalid and set to NaN.
+
+    Returns
+    -------
+    pan: np.ndarray
+        Array of shape (T,) with the camera pan in metres.
+    """
+    center = np.array([image_size[1] / 2, image_size[0] / 2, 1.])
+    projected = homography_matrices @ center
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pan = projected[:, 0] / projected[:, 2]
+    pan[~(np.abs(pan) <= max_abs_x)] = np.nan
+
+    return pan
+
+
+def tracking_motion_signal(positions, reference="Ball"):
+    """Calculates the horizontal position of the ball or the centroid of all players.
+
+    Parameters
+    ----------
+    positions: dict
+        Dictionary with floodlight XY objects of one half (e.g. `positions["firstHalf"]`
+        as returned by `read_position_data_xml`).
+    reference: {"Ball", "Centroid"}
+        Whether the ball or the centroid of both teams is used.
+
+    Returns
+    -------
+    motion: np.ndarray
+        Array of shape (T,) with the x-coordinate in metres.
+    """
+    if reference == "Ball":
+        return positions["Ball"].x[:, 0].astype(float)
+    if reference == "Centroid":
+        x = np.hstack([positions["Home"].x, positions["Away"].x])
+        with np.errstate(invalid="ignore"):
+            return np.nanmean(x, axis=1)
+    raise ValueError(f"Expected reference to be 'Ball' or 'Centroid', got {reference}")
+
+
+def estimate_sync_offset(video_signal, tracking_signal, max_lag=750, use_velocity=True):
+    """Estimates the frame offset between two signals by FFT-based cross-correlation.
+
+    Missing values are excluded and the correlation at every lag is normalized by the
+    number of overlapping valid frames.
+
+    Parameters
+    ----------
+    video_signal: np.ndarray
+        Signal derived from the video, e.g. as returned by `camera_pan_signal`.
+    tracking_signal: np.ndarray
+        Signal derived from the tracking data, e.g. as returned by `tracking_motion_signal`.
+    max_lag: int
+        Search window in frames. Only offsets in [-max_lag, max_lag] are considered.
+    use_velocity: bool
+        Whether the frame-wise differences of both signals are correlated (sharper peak)
+        instead of the positions.
+
+    Returns
+    -------
+    offset: int
+        Estimated offset, i.e. tracking row = video row + offset.
+    score: float
+        Normalized correlation at the estimated offset (1 for a perfect match).
+
+    Raises
+    ------
+    ValueError
+        If one of the signals is missing or constant (e.g. a static camera), or if the
+        signals do not overlap within the search window.
+    """
+    signals = []
+    for name, signal in (("video", video_signal), ("tracking", tracking_signal)):
+        signal = np.asarray(signal, dtype=float)
+        if use_velocity and len(signal) > 1:
+            signal = np.gradient(signal)
+        valid = np.isfinite(signal)
+        if not valid.any():
+            raise ValueError(f"The {name} signal does not contain any valid frame")
+        signal = np.where(valid, signal - np.mean(signal[valid]), 0.)
+        norm = np.sqrt(np.sum(signal ** 2) / np.sum(valid))
+        if not norm > 0:
+            raise ValueError(f"The {name} signal is constant")
+        signals.append((signal / norm, valid.astype(float)))
+    (video, video_valid), (tracking, tracking_valid) = signals
+
+    correlation = correlate(tracking, video, method="fft")
+    overlap = correlate(tracking_valid, video_valid, method="fft")
+    lags = correlation_lags(len(tracking), len(video))
+
+    in_window = (np.abs(lags) <= max_lag) & (np.round(overlap) > 0)
+    if not in_window.any():
+        raise ValueError("Signals do not overlap within the search window")
+    correlation = correlation[in_window] / np.round(overlap[in_window])
+    lags = lags[in_window]
+
+    peak = np.argmax(correlation)
+    return int(lags[peak]), float(correlation[peak])
+
+
+def estimate_sync_offsets(homography_matrices, positions, first_frames=None, max_lag=750, reference="Ball",
+                          use_velocity=True, min_score=0.3):
+    """Estimates the video/tracking offsets for every half of a match.
+
+    Parameters
+    ----------
+    homography_matrices: dict
+        Dictionary {half: np.ndarray of shape (T, 3, 3)}. Halves without (valid) homographies
+        may be missing.
+    positions: dict
+        Dictionary {half: {team: XY}} as returned by `read_position_data_xml`.
+    first_frames: dict, optional
+        Video frame number of the first homography per half, as returned by
+        `homography_series`. Defaults to 0.
+    max_lag: int
+        Search window in frames. The window is applied to the lag between the homography
+        rows and the tracking frames (see `estimate_sync_offset`), i.e. it is centred on
+        aligning the first homography with the first tracking frame, not on offset 0.
+        Only offsets in [-max_lag - first_frame, max_lag - first_frame] are considered.
+    use_velocity:
+        See `estimate_sync_offset`.
+    reference: {"Ball", "Centroid"}
+        See `tracking_motion_signal`.
+    min_score: float
+        Offsets with a lower correlation score are flagged as not reliable.
+
+    Returns
+    -------
+    offsets: dict
+        Dictionary {half: {"offset": int, "score": float, "reliable": bool}}, i.e.
+        tracking frame = video frame + offset. Offset and score are None for halves
+        without a usable signal.
+    """
+    offsets = {}
+    for half in positions:
+        offsets[half] = {"offset": None, "score": None, "reliable": False}
+        if half not in homography_matrices:
+            continue
+        try:
+            offset, score = estimate_sync_offset(
+                camera_pan_signal(np.asarray(homography_matrices[half])),
+                tracking_motion_signal(positions[half], reference=reference),
+                max_lag=max_lag,
+                use_velocity=use_velocity
+            )
+        except ValueError:
+            continue
+        # offset of the homography rows to the video frame numbers (the search window of
+        # `max_lag` frames is centred on -first_frame, i.e. on aligning the first rows)
+        offset -= (first_frames or {}).get(half, 0)
+        offsets[half] = {"offset": offset, "score": score, "reliable": score >= min_score}
+
+    return offsets
+
+
+def load_sync_offsets(file, default=None):
+    """Reads the offsets written by `estimate_sync_offsets.py`.
+
+    Parameters
+    ----------
+    file: str
+        JSON file {half: {"offset": int, "score": float, "reliable": bool}}.
+    default: dict, optional
+        Offsets {half: int} used for halves without a reliable estimate or if the file
+        does not exist, e.g. `KICKOFF_OFFSETS[match_id]`.
+
+    Returns
+    -------
+    offsets: dict
+        Dictionary {half: int}, i.e. tracking frame = video frame + offset.
+    """
+    offsets = dict(default or {})
+    if os.path.exists(file):
+        with open(file) as f:
+            for half, result in json.load(f).items():
+                if result["reliable"]:
+                    offsets[half] = result["offset"]
+                elif half not in offsets:
+                    raise ValueError(f"No reliable offset for {half} in {file} (score {result['score']})")
+
+    return offsets
@@ -4,19 +4,23 @@ utils.py
 This module provides helper functions for:
 
 - Reading vid2pos output files containing homography matrices (`vid2pos_reader`).
+- Converting vid2pos output into smoothed frame-wise homography series (`homography_series`).
 - Warping video frames into pitch coordinates (`generate_topview_mask`).
 - Converting field of view masks into Shapely polygon objects (`mask2pitchpolygon`).
+- Projecting the field of view of a frame onto the pitch (`homography2pitchpolygon`).
+- Reusing field of view polygons for near-static camera frames (`fov_displacement`, `CoherentFovProjector`).
+- Determining which players of a frame are within the field of view (`frame_visibility`).
+- Determining the frame-wise visibility of a team, reusing unchanged polygons (`player_visibility`).
 - Calculating distance covered per player across defined speed zones (`distance_covered_per_zone`).
+- Reading the labelled possession phases (`read_phase_labels`).
 """
 
 import jsonlines
-import torch
-import kornia
 import shapely
-import rasterio.features
 import shapely.affinity
 import numpy as np
 import pandas as pd
+from scipy.signal import savgol_filter
 
 
 def vid2pos_reader(file):
@@ -45,7 +49,70 @@ def vid2pos_reader(file):
     return vid2pos_output
 
 
-def generate_topview_mask(h: torch.tensor, source_size=(720, 1280), target_size=(68, 105), target_scale=1.):
+def homography_series(vid2pos_output, n_frames, first_frame=None, interpolation_limit=25, window_length=31,
+                      polyorder=3):
+    """Converts vid2pos output into an array of frame-wise homography matrices.
+
+    Row i of the output holds the homography of video frame `first_frame + i`. Missing
+    matrices are linearly interpolated (up to `interpolation_limit` frames) and the series
+    is smoothed with a Savitzky-Golay filter.
+
+    Parameters
+    ----------
+    vid2pos_output: List of dict
+        Output of `vid2pos_reader`.
+    n_frames: int
+        Number of frames of the half, e.g. as given in `MATCH_LENGTH`.
+    first_frame: int, optional
+        Video frame number (`frame_number_refs`) of the first row, e.g. -offset to index
+        the series by tracking frame (tracking frame = video frame + offset). Defaults to
+        the first valid homography. Homographies outside the n_frames rows are dropped.
+    interpolation_limit: int
+        Maximum number of consecutive missing frames to fill.
+    window_length, polyorder: int
+        Parameters of the Savitzky-Golay filter.
+
+    Returns
+    -------
+    homography_matrices: np.ndarray
+        Array of shape (n_frames, 3, 3). Frames without a homography are NaN.
+    first_frame: int
+        Video frame number of the first row.
+    """
+    # Filter out invalid entries
+    frames = [frame for frame in vid2pos_output if frame["homography"][0][0] is not None]
+    if not frames:
+        raise ValueError("vid2pos output does not contain any valid homography")
+    if first_frame is None:
+        first_frame = frames[0]["frame_number_refs"]
+
+    # Fill known homographies
+    homography_matrices = np.full((n_frames, 3, 3), np.nan)
+    for frame in frames:
+        row_idx = frame["frame_number_refs"] - first_frame
+        if 0 <= row_idx < n_frames:
+            homography_matrices[row_idx] = np.array(frame["homography"])
+
+    # Interpolate missing values
+    for i in range(3):
+        for j in range(3):
+            homography_matrices[:, i, j] = pd.Series(
+                homography_matrices[:, i, j]
+            ).interpolate("linear", limit=interpolation_limit, limit_direction="both")
+
+    # Smooth homography matrices using Savitzky-Golay filter
+    homography_matrices = savgol_filter(
+        homography_matrices, window_length=window_length, polyorder=polyorder, axis=0, mode="nearest"
+    )
+
+    return homography_matrices, first_frame
+
+
+def generate_topview_mask(h: "torch.tensor", source_size=(720, 1280), target_size=(68, 105), target_scale=1.):
+    # imported here, so that modules using only the other helpers run without torch/kornia
+    import torch
+    import kornia
+
     def _warp_img(H, img):
         # scaling matrix for better image resolution
         S = torch.eye(3).unsqueeze(0)
@@ -71,6 +138,7 @@ def generate_topview_mask(h: torch.tensor, source_size=(720, 1280), target_size=
     return warped_top
 
 def mask2pitchpolygon(mask: np.ndarray, target_scale: float):
+    import rasterio.features  # imported here, see `generate_topview_mask`
 
     def _mask_to_polygons_layer(mask:np.array) -> shapely.geometry.Polygon:
         """Converting mask to polygon object
@@ -107,6 +175,198 @@ def mask2pitchpolygon(mask: np.ndarray, target_scale: float):
         return None
 
 
+def homography2pitchpolygon(homography, target_scale=1.):
+    """Projects the camera field of view of a single frame onto the pitch.
+
+    Parameters
+    ----------
+    homography: np.ndarray
+        Homography matrix (3 x 3) of the frame.
+    target_scale: float
+        Scale of the top-view projection.
+
+    Returns
+    -------
+    polygon: shapely.geometry.Polygon or None
+        Field of view in pitch coordinates, None if it does not intersect the pitch.
+    """
+    mask = generate_topview_mask(homography, target_scale=target_scale).numpy()
+    return mask2pitchpolygon(np.round(mask), target_scale)
+
+
+def fov_displacement(homography_ref, homography, polygon):
+    """Calculates the maximum displacement of the field of view corners on the pitch.
+
+    Every corner of `polygon` (projected with `homography_ref`) is mapped back into the
+    image and projected again with `homography`.
+
+    Parameters
+    ----------
+    homography_ref, homography: np.ndarray
+        Homography matrices (3 x 3) of the reference and the current frame.
+    polygon: shapely.geometry.Polygon
+        Field of view of the reference frame in pitch coordinates, as returned by
+        `homography2pitchpolygon` (target scale 1).
+
+    Returns
+    -------
+    displacement: float
+        Maximum corner displacement in metres (inf if it cannot be determined).
+    """
+    x, y = np.array(polygon.exterior.xy)
+    # pitch coordinates to the centered (and y-flipped) coordinates of the homographies
+    corners = np.vstack([x - 105 / 2, 68 / 2 - y, np.ones_like(x)])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        image_points = np.linalg.solve(homography_ref, corners)
+        projected = homography @ image_points
+        projected = projected[:2] / projected[2]
+        displacement = np.max(np.linalg.norm(projected - corners[:2], axis=0))
+
+    return float(displacement) if np.isfinite(displacement) else np.inf
+
+
+class CoherentFovProjector:
+    """Projects the field of view frame by frame and reuses the previous polygon as long as
+    the camera is nearly static.
+
+    The polygon of the last projected (reference) frame is reused until the maximum corner
+    displacement between the reference and the current homography (`fov_displacement`)
+    exceeds `tolerance`.
+
+    Parameters
+    ----------
+    tolerance: float
+        Maximum corner displacement on the pitch in metres. 0 projects every frame.
+    target_scale: float
+        Scale of the top-view projection.
+
+    Attributes
+    ----------
+    n_frames, n_reused: int
+        Number of frames processed and frames with reused polygons.
+    max_error: float
+        Largest corner displacement (in metres) of a reused polygon.
+    """
+
+    def __init__(self, tolerance=0.1, target_scale=1.):
+        self.tolerance = tolerance
+        self.target_scale = target_scale
+        self.n_frames = 0
+        self.n_reused = 0
+        self.max_error = 0.
+        self._homography_ref = None
+        self._polygon_ref = None
+
+    @property
+    def reuse_rate(self):
+        return self.n_reused / self.n_frames if self.n_frames else 0.
+
+    def __call__(self, homography):
+        """Returns the field of view polygon of the frame (see `homography2pitchpolygon`)."""
+        self.n_frames += 1
+        homography = np.asarray(homography)
+
+        if self.tolerance > 0 and self._polygon_ref is not None and np.isfinite(homography).all():
+            displacement = fov_displacement(self._homography_ref, homography, self._polygon_ref)
+            if displacement <= self.tolerance:
+                self.n_reused += 1
+                self.max_error = max(self.max_error, displacement)
+                return self._polygon_ref
+
+        polygon = homography2pitchpolygon(homography, target_scale=self.target_scale)
+        valid = polygon is not None and np.isfinite(homography).all()
+        self._homography_ref = homography if valid else None
+        self._polygon_ref = polygon if valid else None
+
+        return polygon
+
+
+def frame_visibility(frame, pitch_polygon):
+    """Determines which players of a single frame are within the field of view.
+
+    Parameters
+    ----------
+    frame: np.ndarray
+        Player positions of the frame (x1, y1, x2, y2, ...).
+    pitch_polygon: shapely.geometry.Polygon or None
+        Field of view in pitch coordinates. If None, no player is visible. Prepare it
+        (`shapely.prepare`) when it is reused for several frames.
+
+    Returns
+    -------
+    visible: np.ndarray
+        Array of length N with 1 (visible) and 0 (not visible). Players without position
+        are returned as visible and have to be masked separately.
+    """
+    visible = np.ones(len(frame) // 2)
+    if pitch_polygon is None:
+        visible[:] = 0
+        return visible
+
+    # Check if each player's position lies within the field of view polygon
+    # (vectorised, uses the prepared geometry of the polygon if available)
+    x, y = np.asarray(frame[::2], dtype=float), np.asarray(frame[1::2], dtype=float)
+    has_position = ~np.isnan(x) & ~np.isnan(y)
+    visible[has_position & ~shapely.contains_xy(pitch_polygon, x, y)] = 0
+
+    return visible
+
+
+def same_coords(coords, previous_coords):
+    """Checks if two pitch intersections (coordinate arrays or None) are identical."""
+    if coords is None or previous_coords is None:
+        return coords is None and previous_coords is None
+    return np.array_equal(coords, previous_coords)
+
+
+def player_visibility(positions, intersections, frames=None, progress=None):
+    """Determines the frame-wise visibility of all players of a team.
+
+    A (prepared) polygon is only built when the pitch intersection changes, i.e. polygons
+    reused by `CoherentFovProjector` (identical coordinates) are reused here as well.
+
+    Parameters
+    ----------
+    positions: floodlight.XY
+        Player positions (T x 2N) in pitch coordinates.
+    intersections: list
+        Frame-wise pitch intersections ((2 x n) coordinate arrays or None), as stored by
+        `generate_pitch_intersections.py`.
+    frames: np.ndarray, optional
+        Boolean mask of the frames to process. Defaults to all frames.
+    progress: callable, optional
+        Called after every processed frame, e.g. the bar of `alive_bar`.
+
+    Returns
+    -------
+    visible: np.ndarray
+        Array (T x N) with 1 (visible), 0 (not visible) and NaN (no position or frame not
+        processed).
+    """
+    if frames is None:
+        frames = np.ones(len(positions), dtype=bool)
+    visible = np.full((len(positions), positions.N), np.nan)
+
+    pitch_polygon, previous_coords = None, None
+    for frame_idx in np.flatnonzero(frames):
+        coords = intersections[frame_idx]
+
+        # Create (prepared) shapely Polygon from (x, y) coords (no polygon: no player visible)
+        if not same_coords(coords, previous_coords):
+            pitch_polygon = None
+            if coords is not None:
+                pitch_polygon = shapely.geometry.Polygon(zip(coords[0], coords[1]))
+                shapely.prepare(pitch_polygon)
+            previous_coords = coords
+
+        visible[frame_idx] = frame_visibility(positions[frame_idx], pitch_polygon)
+        if progress is not None:
+            progress()
+
+    # Mask visibility where player positions are NaN
+    return np.where(np.isnan(positions.x), np.nan, visible)
+
+
 def distance_covered_per_zone(distances, velocities, speed_zones, speed_zone_names=None):
     """Calculates the distance covered by each player for given speed thresholds.
 
@@ -151,4 +411,34 @@ def distance_covered_per_zone(distances, velocities, speed_zones, speed_zone_nam
     # assemble
     df = pd.DataFrame(data=distances_per_zone, columns=speed_zone_names)
 
-    return df
\ No newline at end of file
+    return df
+
+
+def read_phase_labels(file):
+    """Reads the labelled possession phases and converts the timestamps to seconds.
+
+    Parameters
+    ----------
+    file: str
+        Path to the label file (e.g. `majority.csv`) with "start" and "end" timestamps
+        in the format "MM:SS" counted from the kick-off of the first half.
+
+    Returns
+    -------
+    labels: pd.DataFrame
+        Labels with additional columns "start_seconds" and "end_seconds" (seconds within
+        the half) and "half" ("firstHalf" or "secondHalf").
+    """
+    labels = pd.read_csv(file)
+
+    # Add timestamps in seconds
+    labels["start_seconds"] = labels["start"].str[:2].astype(int) * 60 + labels["start"].str[3:5].astype(int)
+    labels["end_seconds"] = labels["end"].str[:2].astype(int) * 60 + labels["end"].str[3:5].astype(int)
+
+    # Define halves
+    labels["half"] = "firstHalf"
+    labels.loc[labels["start_seconds"] >= 45 * 60, "half"] = "secondHalf"
+    labels.loc[labels['half'] == "secondHalf", 'start_seconds'] -= 45 * 60
+    labels.loc[labels['half'] == "secondHalf", 'end_seconds'] -= 45 * 60
+
+    return labels
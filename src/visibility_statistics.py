@@ -0,0 +1,278 @@
+"""
+visibility_statistics.py
+
+This module provides helper functions for the visibility statistics of
+`supplemental_statistics.ipynb` that scale to many matches:
+
+- Streaming player visibility files match by match (`stream_visibility_files`).
+- Accumulating histograms of visible-player counts (overall, ball active/inactive) and
+  role-wise visibility means incrementally (`VisibilityAccumulator`, `accumulate_visibility`).
+- Vectorised, multi-process bootstrap confidence intervals for grouped tables such as the
+  role x source visibility and distance-percent tables (`bootstrap_ci`, `bootstrap_table`).
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import jdata as jd
+from concurrent.futures import ProcessPoolExecutor
+
+
+class VisibilityAccumulator:
+    """Incremental statistics of frame-wise player visibility.
+
+    Visibility arrays (T x N) contain 1 (visible), 0 (not visible) and NaN (player not on
+    the pitch). The number of visible players is counted per frame and team, as in the
+    concatenated arrays of the original notebook.
+
+    Parameters
+    ----------
+    max_players: int
+        Largest number of visible players per team and frame to expect.
+    """
+
+    def __init__(self, max_players=11):
+        self.counts = np.zeros(max_players + 1, dtype=np.int64)
+        self.counts_active = np.zeros(max_players + 1, dtype=np.int64)
+        self.counts_inactive = np.zeros(max_players + 1, dtype=np.int64)
+        self.role_visible = {}
+        self.role_frames = {}
+
+    def _add_histogram(self, name, counts):
+        n_missing = len(counts) - len(self.counts)
+        if n_missing > 0:
+            # grow histograms if more players than expected are visible
+            for other in ("counts", "counts_active", "counts_inactive"):
+                setattr(self, other, np.pad(getattr(self, other), (0, n_missing)))
+        getattr(self, name)[:len(counts)] += counts
+
+    def update(self, visible, ballstatus=None, roles=None):
+        """Adds the visibility of one team and half.
+
+        Parameters
+        ----------
+        visible: np.ndarray
+            Visibility array (T x N).
+        ballstatus: np.ndarray, optional
+            Ball status per frame (1: active, 0: inactive).
+        roles: list, optional
+            Role of each of the N players (e.g. "DEF"); players with role None are skipped.
+        """
+        visible = np.asarray(visible, dtype=float)
+        n_visible = np.nansum(visible, axis=1).astype(np.int64)
+        self._add_histogram("counts", np.bincount(n_visible))
+        if ballstatus is not None:
+            active = np.asarray(ballstatus)[:len(n_visible)] == 1
+            self._add_histogram("counts_active", np.bincount(n_visible[active]))
+            self._add_histogram("counts_inactive", np.bincount(n_visible[~active]))
+
+        if roles is not None:
+            visible_sum = np.nansum(visible, axis=0)
+            frames = np.sum(~np.isnan(visible), axis=0)
+            for role, role_sum, role_frames in zip(roles, visible_sum, frames):
+                if role is None:
+                    continue
+                self.role_visible[role] = self.role_visible.get(role, 0.) + role_sum
+                self.role_frames[role] = self.role_frames.get(role, 0) + role_frames
+
+    def merge(self, other):
+        """Adds the statistics of another accumulator (e.g. computed in another process)."""
+        for name in ("counts", "counts_active", "counts_inactive"):
+            self._add_histogram(name, getattr(other, name))
+        for role in other.role_visible:
+            self.role_visible[role] = self.role_visible.get(role, 0.) + other.role_visible[role]
+            self.role_frames[role] = self.role_frames.get(role, 0) + other.role_frames[role]
+        return self
+
+    @property
+    def n_frames(self):
+        return int(self.counts.sum())
+
+    def frequencies(self):
+        """Returns the relative frequencies of visible-player counts as a DataFrame with the
+        columns "all", "active" and "inactive" (each relative to all frames, as in Figure 2)."""
+        n_frames = max(self.n_frames, 1)
+        return pd.DataFrame({
+            "all": self.counts / n_frames,
+            "active": self.counts_active / n_frames,
+            "inactive": self.counts_inactive / n_frames,
+        })
+
+    def role_means(self):
+        """Returns the mean visibility per role (visible frames / frames on the pitch)."""
+        return pd.Series({
+            role: self.role_visible[role] / self.role_frames[role] if self.role_frames[role] else np.nan
+            for role in self.role_visible
+        })
+
+
+def stream_visibility_files(path, sources=("SF", "TV"), matches=None, n_frames=45 * 60 * 25):
+    """Loads player visibility files one at a time.
+
+    Parameters
+    ----------
+    path: str
+        Folder containing `<source>_<match>_visible_with_ballstatus.json` files.
+    sources: tuple
+        Sources to load.
+    matches: list, optional
+        Matches to load. Defaults to all matches found in `path`.
+    n_frames: int
+        Number of frames per half to keep (first 45 minutes at 25 fps).
+
+    Yields
+    ------
+    source, match, half, team, visible, ballstatus:
+        Visibility array (T x N) and ball status (T,) of one team and half.
+    """
+    for file in sorted(os.listdir(path)):
+        if not file.endswith("_visible_with_ballstatus.json"):
+            continue
+        source, match = file.split("_")[0], file.split("_")[1]
+        if source not in sources or (matches is not None and match not in matches):
+            continue
+        visible = jd.load(os.path.join(path, file))
+        for half in visible:
+            ballstatus = np.asarray(visible[half]["ballstatus"])[:n_frames]
+            for team in ["Home", "Away"]:
+                yield source, match, half, team, np.asarray(visible[half][team])[:n_frames], ballstatus
+        del visible
+
+
+def _accumulate_file(path, source, match, n_frames, roles, max_players):
+    accumulator = VisibilityAccumulator(max_players=max_players)
+    for _, _, half, team, visible, ballstatus in stream_visibility_files(path, (source,), [match], n_frames):
+        team_roles = roles.get(match, {}).get(team) if roles is not None else None
+        accumulator.update(visible, ballstatus, roles=team_roles)
+    return source, accumulator
+
+
+def accumulate_visibility(path, sources=("SF", "TV"), matches=None, n_frames=45 * 60 * 25, roles=None,
+                          max_players=11, processes=1):
+    """Accumulates visibility statistics per source while streaming match files.
+
+    Parameters
+    ----------
+    path, sources, matches, n_frames:
+        See `stream_visibility_files`.
+    roles: dict, optional
+        Dictionary {match: {team: [role per xID]}} for role-wise means.
+    max_players: int
+        See `VisibilityAccumulator`.
+    processes: int
+        Number of processes; every process handles one match file at a time.
+
+    Returns
+    -------
+    accumulators: dict
+        Dictionary {source: VisibilityAccumulator}.
+    """
+    jobs = []
+    for file in sorted(os.listdir(path)):
+        if not file.endswith("_visible_with_ballstatus.json"):
+            continue
+        source, match = file.split("_")[0], file.split("_")[1]
+        if source in sources and (matches is None or match in matches):
+            jobs.append((path, source, match, n_frames, roles, max_players))
+
+    accumulators = {source: VisibilityAccumulator(max_players=max_players) for source in sources}
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_accumulate_file, *zip(*jobs))) if jobs else []
+    else:
+        results = [_accumulate_file(*job) for job in jobs]
+    for source, accumulator in results:
+        accumulators[source].merge(accumulator)
+
+    return accumulators
+
+
+def bootstrap_ci(values, n_boot=10000, ci=95, statistic=np.mean, seed=None, batch_size=1000):
+    """Calculates a percentile bootstrap confidence interval.
+
+    Resamples are drawn as an index matrix and evaluated in batches of `batch_size`, i.e.
+    `statistic` has to support the `axis` argument.
+
+    Parameters
+    ----------
+    values: np.ndarray
+        Sample (NaN values are dropped).
+    n_boot: int
+        Number of bootstrap resamples.
+    ci: float
+        Confidence level in percent.
+    statistic: callable
+        Statistic, e.g. np.mean or np.median.
+    seed: int or np.random.SeedSequence, optional
+        Seed of the random number generator.
+
+    Returns
+    -------
+    estimate, ci_low, ci_high: float
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.nan, np.nan, np.nan
+
+    rng = np.random.default_rng(seed)
+    estimates = np.empty(n_boot)
+    for start in range(0, n_boot, batch_size):
+        size = min(batch_size, n_boot - start)
+        idx = rng.integers(0, len(values), size=(size, len(values)))
+        estimates[start:start + size] = statistic(values[idx], axis=1)
+
+    ci_low, ci_high = np.percentile(estimates, [(100 - ci) / 2, 100 - (100 - ci) / 2])
+    return float(statistic(values)), float(ci_low), float(ci_high)
+
+
+def _bootstrap_task(args):
+    key, column, values, n_boot, ci, statistic, seed = args
+    return key, column, bootstrap_ci(values, n_boot=n_boot, ci=ci, statistic=statistic, seed=seed)
+
+
+def bootstrap_table(df, by=("role", "source"), columns=("visible", "distance_percent"), n_boot=10000, ci=95,
+                    statistic=np.mean, seed=0, processes=1):
+    """Calculates bootstrap confidence intervals for every group and column of a table.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Table with one row per player and match, e.g. `intensity_metrics.csv`.
+    by: tuple
+        Grouping columns.
+    columns: tuple
+        Columns to calculate confidence intervals for.
+    n_boot, ci, statistic:
+        See `bootstrap_ci`.
+    seed: int
+        Seed; every group and column gets an independent random stream, so results do not
+        depend on the number of processes.
+    processes: int
+        Number of processes; groups and columns are distributed across processes.
+
+    Returns
+    -------
+    table: pd.DataFrame
+        One row per group with the columns "<column>", "<column>_ci_low", "<column>_ci_high".
+    """
+    groups = list(df.groupby(list(by)))
+    seeds = np.random.SeedSequence(seed).spawn(len(groups) * len(columns))
+    tasks = [
+        (key, column, group[column].to_numpy(), n_boot, ci, statistic, seeds[i * len(columns) + j])
+        for i, (key, group) in enumerate(groups)
+        for j, column in enumerate(columns)
+    ]
+
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_bootstrap_task, tasks))
+    else:
+        results = [_bootstrap_task(task) for task in tasks]
+
+    rows = {}
+    for key, column, (estimate, ci_low, ci_high) in results:
+        row = rows.setdefault(key, dict(zip(by, key if isinstance(key, tuple) else (key,))))
+        row.update({column: estimate, f"{column}_ci_low": ci_low, f"{column}_ci_high": ci_high})
+
+    return pd.DataFrame(list(rows.values())).set_index(list(by))
@@ -0,0 +1,71 @@
+import threading
+import time
+
+from src.prefetch import Prefetcher
+
+
+def _loader(started, load_seconds=0.05):
+    def load(job):
+        started[job].set()
+        time.sleep(load_seconds)
+        return job
+    return load
+
+
+def test_prefetch_overlaps_at_two_job_budget():
+    jobs = list(range(6))
+    started = {job: threading.Event() for job in jobs}
+    prefetcher = Prefetcher(jobs, _loader(started), size_function=lambda job: 100, max_bytes=200)
+
+    processed = []
+    for job, inputs in prefetcher:
+        assert inputs == job
+        # the following job is loaded while the current one is processed
+        if job + 1 < len(jobs):
+            assert started[job + 1].wait(timeout=2)
+        processed.append(job)
+
+    assert processed == jobs
+    assert prefetcher.peak_reserved_bytes == 200
+    assert prefetcher.reserved_bytes == 0
+
+
+def test_prefetch_overlap_reduces_runtime():
+    jobs = list(range(6))
+    started = {job: threading.Event() for job in jobs}
+
+    runtime = {}
+    for max_bytes in (100, 200):
+        start = time.perf_counter()
+        for _ in Prefetcher(jobs, _loader(started, load_seconds=0.1), size_function=lambda job: 100,
+                            max_bytes=max_bytes):
+            time.sleep(0.15)
+        runtime[max_bytes] = time.perf_counter() - start
+
+    # serial: 6 x (0.1 + 0.15) s, overlapped: 0.1 s + 6 x 0.15 s
+    assert runtime[200] < runtime[100] - 0.3
+
+
+def test_prefetch_budget_of_one_job_loads_on_request():
+    jobs = list(range(4))
+    started = {job: threading.Event() for job in jobs}
+    prefetcher = Prefetcher(jobs, _loader(started, load_seconds=0.), size_function=lambda job: 100, max_bytes=100)
+
+    for job, _ in prefetcher:
+        time.sleep(0.05)
+        if job + 1 < len(jobs):
+            assert not started[job + 1].is_set()
+
+    assert prefetcher.peak_reserved_bytes == 100
+
+
+def test_prefetch_releases_reservations_when_stopped_early():
+    jobs = list(range(5))
+    started = {job: threading.Event() for job in jobs}
+    prefetcher = Prefetcher(jobs, _loader(started), size_function=lambda job: 100, max_bytes=300)
+
+    iterator = iter(prefetcher)
+    next(iterator)
+    iterator.close()
+
+    assert prefetcher.reserved_bytes == 0